@@ -1,6 +1,7 @@
 import importlib
 import os
 import sys
+import time
 
 NODE_CLASS_MAPPINGS = {}
 NODE_DISPLAY_NAME_MAPPINGS = {}
@@ -22,12 +23,37 @@ def serialize(obj):
         return obj
     return str(obj)
 
+# 各模块的导入耗时（秒），cv2 等重量级依赖延迟到节点首次运行时才加载
+IMPORT_TIMES = {}
+
+def import_timed(name):
+    start = time.perf_counter()
+    module = importlib.import_module(".py.{}".format(name), __name__)
+    IMPORT_TIMES[name] = time.perf_counter() - start
+    return module
+
+def startup_report():
+    """启动耗时报告：每个模块的导入耗时，以及已经发生的延迟加载"""
+    lines = [f"Put-Tools: 导入耗时 {sum(IMPORT_TIMES.values()) * 1000:.1f} ms"]
+    for name, elapsed in sorted(IMPORT_TIMES.items(), key=lambda item: -item[1]):
+        lines.append(f"  - {name}: {elapsed * 1000:.1f} ms")
+    md = sys.modules.get(__name__ + ".py.md")
+    for name, elapsed in getattr(md, "LAZY_IMPORT_TIMES", {}).items():
+        lines.append(f"  - {name}（首次使用时加载）: {elapsed * 1000:.1f} ms")
+    return "\n".join(lines)
+
 # 采用成功节点的加载方式
 py = get_ext_dir("py")
 if os.path.exists(py):
     files = os.listdir(py)
     all_nodes = {}
     
+    # 公共模块单独计时，不计入第一个导入它的节点模块
+    try:
+        import_timed("md")
+    except Exception as e:
+        print(f"加载公共模块 md 时出错: {e}")
+    
     for file in files:
         if not file.endswith(".py") or file.startswith("_") or file == "md.py":
             continue
@@ -36,7 +62,7 @@ if os.path.exists(py):
         
         try:
             # 使用正确的包导入方式
-            imported_module = importlib.import_module(".py.{}".format(name), __name__)
+            imported_module = import_timed(name)
             
             # 合并节点映射
             if hasattr(imported_module, 'NODE_CLASS_MAPPINGS'):
@@ -62,5 +88,6 @@ if os.path.exists(py):
 print(f"Put-Tools: 成功加载 {len(NODE_CLASS_MAPPINGS)} 个节点")
 for name in NODE_CLASS_MAPPINGS.keys():
     print(f"  - {name}")
+print(startup_report())
 
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS', 'WEB_DIRECTORY']
\ No newline at end of file
@@ -0,0 +1,368 @@
+"""
+性能基准测试 - 脱离ComfyUI运行各节点及其处理阶段
+
+为 server / nodes / folder_paths 提供最小替身，直接调用节点代码，
+按 图像尺寸 × 批次大小 × 填充模式 / 边框宽度 的组合计时，
+每个组合输出一行JSON（墙钟时间和峰值内存），便于比较不同版本和不同计算后端。
+
+用法：
+    python benchmark.py --quick
+    python benchmark.py --sizes 512 2048 --batches 1 16 --device cuda --output bench_output.txt
+"""
+import argparse
+import gc
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import types
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = [512, 1024, 2048, 4096, 8192]
+DEFAULT_BATCHES = [1, 4, 16, 64, 256]
+DEFAULT_FILLS = ["transparent", "black", "white", "blur"]
+DEFAULT_BORDER_WIDTHS = [0, 10, 50, 200]
+DEFAULT_SMOOTH_MODES = ["distance", "gaussian"]
+QUICK = {"sizes": [512, 1024], "batches": [1, 4], "border_widths": [0, 20]}
+
+def install_comfy_stubs():
+    """ComfyUI 运行环境之外，为节点导入的 server / nodes / folder_paths 安装最小替身"""
+    try:
+        import server  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    class Routes:
+        def _register(self, path):
+            return lambda handler: handler
+        get = post = put = delete = _register
+
+    class PromptServer:
+        def __init__(self):
+            self.routes = Routes()
+            self.client_id = None
+
+        def send_sync(self, event, data, sid=None):
+            pass
+
+    server = types.ModuleType("server")
+    server.PromptServer = PromptServer
+    server.PromptServer.instance = PromptServer()
+
+    nodes = types.ModuleType("nodes")
+    nodes.LoadImage = type("LoadImage", (), {})
+    nodes.PreviewImage = type("PreviewImage", (), {})
+
+    folder_paths = types.ModuleType("folder_paths")
+    temp_dir = os.path.join(ROOT, "temp")
+    folder_paths.get_temp_directory = lambda: temp_dir
+    folder_paths.get_output_directory = lambda: temp_dir
+    folder_paths.get_input_directory = lambda: temp_dir
+
+    sys.modules.update({"server": server, "nodes": nodes, "folder_paths": folder_paths})
+    return True
+
+def load_node_modules():
+    """把仓库作为包导入（不执行根目录 __init__.py 的节点注册），返回节点模块和 core 中的算法模块"""
+    # 节点内置的分阶段统计会在后台线程采样内存，基准测试自己测量峰值，关闭以免相互干扰
+    os.environ.setdefault("PUT_TOOLS_METRICS", "0")
+    package = types.ModuleType("put_tools")
+    package.__path__ = [ROOT]
+    sys.modules.setdefault("put_tools", package)
+    names = ("irregular_cropper", "mask_white_border", "mask_layer_effects",
+             "core.selection", "core.border", "core.layers")
+    # 依赖在预热阶段加载，不逐个打印加载耗时
+    importlib.import_module("put_tools.py.core.common").LAZY_IMPORT_VERBOSE = False
+    return {name: importlib.import_module(f"put_tools.py.{name}") for name in names}
+
+def _load_libc():
+    """glibc 下固定 mmap 阈值：大块内存释放后立即归还系统，常驻内存的增量才能反映实际分配"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL("libc.so.6")
+        libc.mallopt(-3, 128 * 1024)  # M_MMAP_THRESHOLD，设置后不再动态上调
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+_libc = _load_libc()
+
+class PeakMemory:
+    """测量代码块的峰值内存（相对进入时的增量，字节）
+
+    CUDA 上使用 PyTorch 分配器的峰值统计；CPU 上后台线程采样进程常驻内存（Linux），
+    其他平台退化为进程级最大常驻内存的增量。
+    """
+
+    def __init__(self, device, interval=0.001):
+        self.device = device
+        self.interval = interval
+        self.peak = 0
+
+    def __enter__(self):
+        import torch
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+            self.base = torch.cuda.memory_allocated(self.device)
+            return self
+
+        if _libc is not None:
+            _libc.malloc_trim(0)
+        self.base = self._rss()
+        self.peak = self.base
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        import torch
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+            self.peak = torch.cuda.max_memory_allocated(self.device)
+        else:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, self._rss())
+        self.peak = max(0, self.peak - self.base)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    @staticmethod
+    def _rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            import resource
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def measure(fn, device, repeats, warmup, setup=None):
+    """运行 warmup 次预热后计时 repeats 次，返回墙钟时间（毫秒）和峰值内存"""
+    import torch
+
+    def sync():
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples, peak = [], 0
+    for _ in range(repeats):
+        if setup:
+            setup()
+        gc.collect()
+        with PeakMemory(device) as memory:
+            sync()
+            start = time.perf_counter()
+            fn()
+            sync()
+            samples.append((time.perf_counter() - start) * 1000)
+        peak = max(peak, memory.peak)
+    return {
+        "wall_ms": round(statistics.median(samples), 3),
+        "wall_ms_min": round(min(samples), 3),
+        "samples_ms": [round(s, 3) for s in samples],
+        "peak_bytes": peak,
+    }
+
+def make_polygon(size, points=96, seed=0):
+    """占画面约六成、带随机起伏的星形多边形（原图像素坐标）"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    radius = size * 0.3 * (1 + 0.15 * np.sin(angles * 7) + 0.05 * rng.standard_normal(points))
+    center = size / 2
+    return np.stack([center + radius * np.cos(angles), center + radius * np.sin(angles)], axis=1)
+
+class Runner:
+    """按参数组合运行所有基准，每个结果写成一行JSON"""
+
+    def __init__(self, args, modules, out):
+        import torch
+        self.args = args
+        self.cropper = modules["core.selection"]
+        self.border_cache = modules["core.border"]._border_cache
+        self.layers = modules["core.layers"]
+        self.border_node = modules["mask_white_border"].MaskWhiteBorder
+        self.layer_node = modules["mask_layer_effects"].MaskLayerEffects
+        self.device = torch.device(args.device)
+        self.out = out
+
+    def emit(self, record):
+        self.out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.out.flush()
+
+    def run(self):
+        import torch
+        args = self.args
+        for size in args.sizes:
+            for batch in args.batches:
+                case = {"size": size, "batch": batch, "device": args.device,
+                        "compute_dtype": args.compute_dtype, "chunk_size": args.chunk_size}
+                input_bytes = batch * size * size * 3 * 4
+                if input_bytes > args.max_bytes:
+                    self.emit({"type": "skipped", **case, "input_bytes": input_bytes,
+                               "reason": "input exceeds --max-bytes"})
+                    continue
+
+                generator = torch.Generator().manual_seed(size * 1000 + batch)
+                image = torch.rand((batch, size, size, 3), generator=generator).to(self.device)
+                polygon = make_polygon(size)
+                mask, _ = self.cropper.build_selection_mask(polygon, size, size)
+                mask = mask.unsqueeze(0).to(self.device)
+
+                if "IrregularCropper" in args.nodes:
+                    self.bench_cropper(case, image, polygon)
+                if "MaskWhiteBorder" in args.nodes:
+                    self.bench_border(case, image, mask)
+                if "MaskLayerEffects" in args.nodes:
+                    self.bench_layers(case, image, mask)
+                del image, mask
+                gc.collect()
+
+    def record(self, node, stage, case, fn, setup=None, **params):
+        try:
+            result = measure(fn, self.device, self.args.repeats, self.args.warmup, setup)
+            status = "ok"
+        except Exception as e:  # 单个组合失败（如内存不足）不中断整个测试
+            result, status = {"error": f"{type(e).__name__}: {e}"}, "error"
+        self.emit({"type": "result", "node": node, "stage": stage, "status": status, **case, **params, **result})
+
+    def bench_cropper(self, case, image, polygon):
+        cropper = self.cropper
+        args = self.args
+        size = case["size"]
+        radius = args.edge_smooth
+        half_width = radius * cropper.FEATHER_WIDTH_RATIO
+
+        # 各阶段单独计时：光栅化 → 平滑 → 合成 → 裁剪
+        self.record("IrregularCropper", "rasterize", case,
+                    lambda: cropper.rasterize_polygon_window(polygon, size, size, args.crop_padding))
+        patch, window = cropper.rasterize_polygon_window(polygon, size, size, args.crop_padding)
+        for mode in args.smooth_modes:
+            smooth = (lambda: cropper._feather_mask(patch, half_width)) if mode == "distance" else \
+                (lambda: cropper._smooth_mask(patch, radius))
+            self.record("IrregularCropper", "smooth", case, smooth, smooth_mode=mode, edge_smooth=radius)
+
+        mask, crop_box = cropper.build_selection_mask(polygon, size, size, radius, True, args.crop_padding)
+        mask = mask.to(self.device)
+        full_mask, _ = cropper.build_selection_mask(polygon, size, size, radius)
+        full_mask = full_mask.to(self.device)
+        self.record("IrregularCropper", "crop", case,
+                    lambda: cropper.crop_images(image, cropper.compute_crop_box(full_mask, args.crop_padding)))
+
+        for fill in args.fills:
+            self.record("IrregularCropper", "composite", case,
+                        lambda: cropper.composite_batch(image, mask, fill, crop_box, args.blur_radius),
+                        background_fill=fill)
+            # 完整流程
+            self.record("IrregularCropper", "apply", case,
+                        lambda: cropper.apply_selection(image, fill, True, args.crop_padding, radius, points=polygon,
+                                                        blur_radius=args.blur_radius, chunk_size=args.chunk_size,
+                                                        compute_dtype=args.compute_dtype),
+                        background_fill=fill, edge_smooth=radius)
+
+    def bench_border(self, case, image, mask):
+        node = self.border_node()
+        setup = None if self.args.warm_cache else self.border_cache.clear
+        for border_width in self.args.border_widths:
+            self.record("MaskWhiteBorder", "crop_with_border", case,
+                        lambda: node.crop_with_border(image, mask, border_width, "white", True, self.args.crop_padding,
+                                                      chunk_size=self.args.chunk_size,
+                                                      compute_dtype=self.args.compute_dtype),
+                        setup, border_width=border_width, warm_cache=self.args.warm_cache)
+
+    def bench_layers(self, case, image, mask):
+        node = self.layer_node()
+        setup = None if self.args.warm_cache else self.border_cache.clear
+        layers = self.layers.DEFAULT_LAYERS
+        self.record("MaskLayerEffects", "apply_layers", case,
+                    lambda: node.apply_layers(image, mask, layers, True, self.args.crop_padding,
+                                              chunk_size=self.args.chunk_size, compute_dtype=self.args.compute_dtype),
+                    setup, layers=len(self.layers.parse_layers(layers)), warm_cache=self.args.warm_cache)
+
+def environment(args, stubbed):
+    import numpy as np
+    import torch
+    record = {
+        "type": "env",
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "torch": torch.__version__,
+        "numpy": np.__version__,
+        "threads": torch.get_num_threads(),
+        "comfy_stubs": stubbed,
+        "args": vars(args),
+    }
+    try:
+        import cv2
+        record["opencv"] = cv2.__version__
+    except ImportError:
+        pass
+    if args.device.startswith("cuda"):
+        record["gpu"] = torch.cuda.get_device_name(torch.device(args.device))
+    return record
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Put-Tools 节点性能基准测试（输出JSON Lines）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="正方形图像边长")
+    parser.add_argument("--batches", type=int, nargs="+", default=DEFAULT_BATCHES, help="批次大小")
+    parser.add_argument("--fills", nargs="+", default=DEFAULT_FILLS, help="IrregularCropper 背景填充模式")
+    parser.add_argument("--border-widths", type=int, nargs="+", default=DEFAULT_BORDER_WIDTHS,
+                        help="MaskWhiteBorder 边框宽度")
+    parser.add_argument("--smooth-modes", nargs="+", default=DEFAULT_SMOOTH_MODES, help="边缘平滑方式")
+    parser.add_argument("--nodes", nargs="+", default=["IrregularCropper", "MaskWhiteBorder", "MaskLayerEffects"])
+    parser.add_argument("--edge-smooth", type=int, default=4)
+    parser.add_argument("--crop-padding", type=int, default=10)
+    parser.add_argument("--blur-radius", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=0)
+    parser.add_argument("--compute-dtype", default="float32", choices=["float32", "float16", "bfloat16"])
+    parser.add_argument("--device", default="cpu", help="cpu / cuda / cuda:1 ...")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--warm-cache", action="store_true", help="MaskWhiteBorder 计时时保留几何缓存（默认每次清空）")
+    parser.add_argument("--max-bytes", type=float, default=4 * 1024 ** 3,
+                        help="输入图像超过该字节数的组合跳过（默认4GiB）")
+    parser.add_argument("--quick", action="store_true", help="只跑小尺寸、小批次的快速组合")
+    parser.add_argument("--output", help="结果写入文件（默认输出到stdout）")
+    args = parser.parse_args(argv)
+    if args.quick:
+        for key, value in QUICK.items():
+            setattr(args, key, value)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    stubbed = install_comfy_stubs()
+    modules = load_node_modules()
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    # 节点自身的日志输出改到stderr，stdout只保留JSON结果
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        runner = Runner(args, modules, out)
+        runner.emit(environment(args, stubbed))
+        runner.run()
+    finally:
+        sys.stdout = stdout
+        if out is not stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+离线批处理命令行 - 不依赖ComfyUI，用进程池批量运行 IrregularCropper / MaskWhiteBorder / MaskLayerEffects 的处理流程
+
+输入为图像文件或目录，mask 或多边形文件按文件名（不含扩展名）与图像对应。
+每个工作进程一次只处理一张图像并直接写入输出目录，主进程只保留有限个待完成任务，
+内存占用与图像总数无关；每张图像的结果（裁剪区域、耗时或错误）实时追加到 manifest.jsonl。
+
+用法：
+    python cli.py crop   images/ --masks masks/ -o out/ --background-fill white --edge-smooth 4
+    python cli.py crop   images/ --polygons polygons/ -o out/ --save-mask
+    python cli.py border images/ --masks masks/ -o out/ --border-width 20 --workers 8
+    python cli.py layers images/ --masks masks/ -o out/ --layers layers.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"}
+POLYGON_EXTENSIONS = {".json", ".txt"}
+
+def list_files(path, extensions):
+    """文件或目录下指定扩展名的文件（按名称排序）"""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if os.path.splitext(name)[1].lower() in extensions
+    )
+
+def index_by_stem(path, extensions):
+    """目录下的文件按文件名（不含扩展名）索引"""
+    if not path:
+        return {}
+    return {os.path.splitext(os.path.basename(file))[0]: file for file in list_files(path, extensions)}
+
+def iter_tasks(args):
+    """逐个生成任务，不预先加载任何图像"""
+    masks = index_by_stem(args.masks, IMAGE_EXTENSIONS)
+    polygons = index_by_stem(args.polygons, POLYGON_EXTENSIONS)
+    settings = {key: value for key, value in vars(args).items() if key not in ("inputs", "func")}
+
+    for path in list_files(args.inputs, IMAGE_EXTENSIONS):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        output = os.path.join(args.output, stem + ".png")
+        if args.skip_existing and os.path.exists(output):
+            continue
+        yield {
+            "input": path,
+            "mask": masks.get(stem),
+            "polygon": polygons.get(stem),
+            "output": output,
+            "settings": settings,
+        }
+
+def load_image(path):
+    """读取图像为 [1,H,W,3] float32 张量（与ComfyUI的 LoadImage 一致，按EXIF方向校正）"""
+    import numpy as np
+    import torch
+    from PIL import Image, ImageOps
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        return torch.from_numpy(np.asarray(image, dtype=np.float32) / 255.0).unsqueeze(0)
+
+def load_mask(path, size):
+    """读取mask图像为 [1,H,W] float32 张量（白色为选中），尺寸与图像不同时缩放"""
+    import numpy as np
+    import torch
+    from PIL import Image, ImageOps
+    with Image.open(path) as mask:
+        mask = ImageOps.exif_transpose(mask).convert("L")
+        if mask.size != size:
+            mask = mask.resize(size, Image.BILINEAR)
+        return torch.from_numpy(np.asarray(mask, dtype=np.float32) / 255.0).unsqueeze(0)
+
+def save_image(tensor, path):
+    """把 [1,H,W,C] 张量保存为PNG（4通道时带透明度）"""
+    import numpy as np
+    from PIL import Image
+    array = (tensor[0].clamp(0, 1).cpu().numpy() * 255 + 0.5).astype(np.uint8)
+    if array.shape[-1] == 1:
+        array = array[..., 0]
+    Image.fromarray(array).save(path)
+
+def init_worker(threads):
+    """每个工作进程限制计算线程数，避免多进程时线程过度订阅；不打印依赖的加载耗时"""
+    import torch
+    from py.core import common
+    common.LAZY_IMPORT_VERBOSE = False
+    torch.set_num_threads(threads)
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+def run_task(task):
+    """在工作进程中处理一张图像：读取 → 处理 → 写入，只返回结果摘要"""
+    from py.core import BorderRenderer, LayerRenderer, apply_selection, edge_smooth_radius, parse_polygon
+
+    start = time.perf_counter()
+    settings = task["settings"]
+    record = {"input": task["input"], "output": task["output"]}
+    try:
+        image = load_image(task["input"])
+        height, width = image.shape[1:3]
+        mask = load_mask(task["mask"], (width, height)) if task["mask"] else None
+
+        if settings["command"] == "crop":
+            points = None
+            if mask is None:
+                if not task["polygon"]:
+                    raise FileNotFoundError("没有对应的mask或多边形文件")
+                with open(task["polygon"], encoding="utf-8") as f:
+                    points = parse_polygon(f.read())
+                if len(points) < 3:
+                    raise ValueError(f"多边形点数量不足: {len(points)}")
+            smooth_radius = edge_smooth_radius(settings["edge_smooth"], width, height)
+            result, result_mask, boxes = apply_selection(
+                image, settings["background_fill"], settings["auto_crop"], settings["crop_padding"], smooth_radius,
+                points=points, mask=mask, smooth_mode=settings["smooth_mode"], blur_radius=settings["blur_radius"]
+            )
+            if settings["save_mask"]:
+                save_image(result_mask.unsqueeze(-1), os.path.splitext(task["output"])[0] + "_mask.png")
+        else:
+            if mask is None:
+                raise FileNotFoundError("没有对应的mask文件")
+            if settings["command"] == "border":
+                result, boxes = BorderRenderer().crop_with_border(
+                    image, mask, settings["border_width"], settings["border_color"], settings["auto_crop"],
+                    settings["crop_padding"]
+                )
+            else:
+                result, boxes = LayerRenderer().apply_layers(
+                    image, mask, settings["layers"], settings["auto_crop"], settings["crop_padding"]
+                )
+
+        save_image(result, task["output"])
+        record.update(status="ok", crop_boxes=json.loads(boxes), shape=list(result.shape[1:]))
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    return record
+
+def run(args):
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = args.manifest or os.path.join(args.output, "manifest.jsonl")
+    workers = args.workers or os.cpu_count() or 1
+    max_pending = args.max_pending or workers * 2
+
+    done = failed = 0
+    start = time.perf_counter()
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        def collect(record):
+            nonlocal done, failed
+            done += 1
+            failed += record["status"] != "ok"
+            manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+            manifest.flush()
+            if record["status"] != "ok":
+                print(f"[Put-Tools] 处理失败 {record['input']}: {record['error']}")
+            elif not args.quiet:
+                print(f"[Put-Tools] {done} {record['input']} -> {record['output']} ({record['seconds']:.2f}s)")
+
+        if args.workers == 1:
+            # 单进程直接处理，便于调试
+            init_worker(args.threads)
+            for task in iter_tasks(args):
+                collect(run_task(task))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(args.threads,)) as pool:
+                pending = set()
+                for task in iter_tasks(args):
+                    # 待完成任务达到上限时先等待，限制排队中的任务数量
+                    if len(pending) >= max_pending:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            collect(future.result())
+                    pending.add(pool.submit(run_task, task))
+                for future in wait(pending).done:
+                    collect(future.result())
+
+    elapsed = time.perf_counter() - start
+    print(f"[Put-Tools] 完成 {done} 张（失败 {failed}），耗时 {elapsed:.1f}s，结果记录: {manifest_path}")
+    return 1 if failed else 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Put-Tools 离线批处理（不依赖ComfyUI）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("inputs", help="图像文件或目录")
+    common.add_argument("--masks", help="mask图像目录（按文件名与图像对应，白色为选中）")
+    common.add_argument("-o", "--output", required=True, help="输出目录")
+    common.add_argument("--no-auto-crop", dest="auto_crop", action="store_false", help="不自动裁剪")
+    common.add_argument("--crop-padding", type=int, default=10)
+    common.add_argument("--workers", type=int, default=0, help="工作进程数，默认CPU核数；1 表示在当前进程中处理")
+    common.add_argument("--threads", type=int, default=1, help="每个工作进程的计算线程数")
+    common.add_argument("--max-pending", type=int, default=0, help="最多排队的任务数，默认工作进程数的2倍")
+    common.add_argument("--manifest", help="结果记录文件，默认为输出目录下的 manifest.jsonl")
+    common.add_argument("--skip-existing", action="store_true", help="跳过已存在输出文件的图像")
+    common.add_argument("--quiet", action="store_true", help="只输出错误和汇总")
+
+    crop = subparsers.add_parser("crop", parents=[common], help="异形裁剪（IrregularCropper 无界面模式）")
+    crop.add_argument("--polygons", help="多边形文件目录（.json 或 .txt，格式同节点的 polygon 输入）")
+    crop.add_argument("--background-fill", default="transparent", choices=["transparent", "black", "white", "blur"])
+    crop.add_argument("--edge-smooth", type=int, default=0, help="边缘平滑程度 (0-20)，与节点参数含义相同")
+    crop.add_argument("--smooth-mode", default="distance", choices=["distance", "gaussian"])
+    crop.add_argument("--blur-radius", type=int, default=4)
+    crop.add_argument("--save-mask", action="store_true", help="同时保存裁剪后的选区mask")
+
+    border = subparsers.add_parser("border", parents=[common], help="添加边框（MaskWhiteBorder）")
+    border.add_argument("--border-width", type=int, default=20)
+    border.add_argument("--border-color", default="white", choices=["white", "black", "gray"])
+
+    layers = subparsers.add_parser("layers", parents=[common], help="多层描边/阴影（MaskLayerEffects）")
+    layers.add_argument("--layers", help="效果层JSON字符串或JSON文件路径，默认与节点相同")
+
+    args = parser.parse_args(argv)
+    args.polygons = getattr(args, "polygons", None)
+    if args.command == "layers":
+        from py.core import DEFAULT_LAYERS, parse_layers
+        if args.layers and os.path.isfile(args.layers):
+            with open(args.layers, encoding="utf-8") as f:
+                args.layers = f.read()
+        args.layers = args.layers or DEFAULT_LAYERS
+        parse_layers(args.layers)  # 提前校验，格式错误时不启动进程池
+    return args
+
+def main(argv=None):
+    return run(parse_args(argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,13 @@
+"""
+Put-Tools 核心算法库，不依赖ComfyUI，可单独导入用于离线批处理：
+
+    from py.core import apply_selection, BorderRenderer, LayerRenderer
+
+节点模块只在此基础上声明输入输出并接入前端交互。
+"""
+
+from .common import *
+from .selection import *
+from .border import *
+from .layers import *
+from .metrics import metrics, stage
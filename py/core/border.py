@@ -0,0 +1,338 @@
+"""
+白边渲染：按到物体的欧氏距离生成边框、窗口化的批量合成和按mask内容缓存的边框几何
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from .common import *
+from .metrics import stage
+
+# 边框颜色（0-1浮点RGB）
+BORDER_COLORS = {
+    "white": (1.0, 1.0, 1.0),
+    "black": (0.0, 0.0, 0.0),
+    "gray": (128 / 255, 128 / 255, 128 / 255),
+}
+# 边框外扩起点的mask阈值：与原先 (mask*255).astype(uint8) 后膨胀一致，非零即参与外扩
+BORDER_MASK_THRESHOLD = 1 / 255
+# 边框几何缓存的内存上限
+BORDER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+def mask_digest(mask):
+    """mask内容的哈希：形状加上全部数据（边框几何对单个像素的变化也敏感，不做抽样）"""
+    data = mask.detach().float().cpu().contiguous().numpy()
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{data.shape}".encode())
+    digest.update(data)
+    return digest.hexdigest()
+
+class BorderCache:
+    """按 (mask内容哈希, 效果参数) 缓存边框几何，跨帧和跨执行复用，超出字节预算时按LRU淘汰"""
+
+    def __init__(self, max_bytes=BORDER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        size = sum(v.element_size() * v.nelement() for v in entry.values() if isinstance(v, torch.Tensor))
+        if size > self.max_bytes:
+            return
+        entry["nbytes"] = size
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry["nbytes"]
+
+_border_cache = BorderCache()
+
+class BorderRenderer:
+    """根据mask自动剪裁异形区域并添加边框（与ComfyUI无关，节点类在此基础上声明输入输出）"""
+
+    def crop_with_border(self, image, mask, border_width, border_color, auto_crop, crop_padding,
+                         batch_crop="per_frame", chunk_size=0, compute_dtype="float32"):
+        # 边框最多延伸 border_width+1 像素（含抗锯齿外缘）；无边框时透明区域保留原图颜色
+        return self.process_batch(image, mask, (border_width, border_color), border_width + 1, auto_crop,
+                                  crop_padding, batch_crop, chunk_size, compute_dtype, keep_rgb=border_width == 0)
+
+    def process_batch(self, image, mask, effect, reach, auto_crop, crop_padding, batch_crop, chunk_size,
+                      compute_dtype, keep_rgb=False):
+        """窗口定位 → 边界框 → 分块合成 → 写入输出 的通用流程，返回 (RGBA图像, 裁剪区域JSON)
+
+        effect 描述物体周围要绘制的效果，由 mask_geometry 和 render_chunk 解释；
+        reach 为效果超出物体的最大距离（像素）。
+        """
+        batch_size, height, width, channels = image.shape
+        device = image.device
+        dtype = resolve_compute_dtype(compute_dtype, device)
+        if mask.dim() == 2:
+            mask = mask.unsqueeze(0)
+
+        # 分块处理，每块 chunk_size 帧，结果直接写入预分配的输出
+        chunk = chunk_size if 0 < chunk_size < batch_size else batch_size
+        chunks = [(start, min(start + chunk, batch_size)) for start in range(0, batch_size, chunk)]
+
+        # 0. 先找出物体所在窗口，后续所有步骤只在窗口内进行
+        #    窗口向外扩展效果的范围，裁剪再加 crop_padding
+        #    （mask不足时用第一帧补齐，并集只需看前 batch_size 帧）
+        margin = reach + (crop_padding if auto_crop else 0)
+        with self.metrics_stage("window", device):
+            window = self.compute_window(mask[:batch_size].to(device), margin) or (0, height, 0, width)
+        top, bottom, left, right = window
+
+        # 1. 自动裁剪：先求出每帧的边界框（原图坐标），确定输出尺寸
+        #    边界框来自每个不同mask的几何信息，不需要合成
+        rendered = None
+        if auto_crop:
+            boxes = []
+            for start, end in chunks:
+                indices, geometries = self.chunk_geometry(mask, start, end, window, effect)
+                for index in indices:
+                    box = self.pad_box(geometries[index]["bbox"], crop_padding, bottom - top, right - left)
+                    boxes.append(None if box is None else (box[0] + top, box[1] + top, box[2] + left, box[3] + left))
+                # 只有一块时直接合成并保留结果
+                if len(chunks) == 1:
+                    with self.metrics_stage("composite", device):
+                        rendered = self.render_chunk(image, mask, start, end, window, indices, geometries, effect,
+                                                     dtype)
+            boxes, out_size = resolve_crop_boxes(boxes, batch_crop, height, width)
+        else:
+            boxes, out_size = [(0, height, 0, width)] * batch_size, (height, width)
+
+        # 结果正好是窗口结果的切片时直接返回
+        if rendered is not None and len(set(boxes)) == 1 and self.box_within(boxes[0], window):
+            box_top, box_bottom, box_left, box_right = boxes[0]
+            result = rendered[:, box_top - top:box_bottom - top, box_left - left:box_right - left]
+            with self.metrics_stage("paste", device):
+                result = result.to(torch.float32)
+            return (result, boxes_to_json(boxes))
+
+        # 2. 逐块合成，写入 float32 输出
+        out = torch.zeros((batch_size,) + out_size + (4,), dtype=torch.float32, device=device)
+        for start, end in chunks:
+            if rendered is None:
+                indices, geometries = self.chunk_geometry(mask, start, end, window, effect)
+                with self.metrics_stage("composite", device):
+                    result = self.render_chunk(image, mask, start, end, window, indices, geometries, effect, dtype)
+            else:
+                result = rendered
+            with self.metrics_stage("paste", device):
+                self.paste_regions(out[start:end], result, image[start:end], window, boxes[start:end], keep_rgb)
+
+        return (out, boxes_to_json(boxes))
+
+    def chunk_geometry(self, mask, start, end, window, effect):
+        """第 start 到 end 帧对应的mask序号（mask[i] 不存在时使用 mask[0]），以及每个不同mask的几何信息"""
+        top, bottom, left, right = window
+        indices = [i if i < len(mask) else 0 for i in range(start, end)]
+        # 包含距离变换（缓存命中时只有哈希）
+        with self.metrics_stage("geometry"):
+            geometries = {
+                index: self.mask_geometry(mask[index, top:bottom, left:right], effect)
+                for index in sorted(set(indices))
+            }
+        return indices, geometries
+
+    def metrics_stage(self, name, device=None):
+        """本节点一个处理阶段的计时上下文，统计时以类名作为节点名"""
+        return stage(type(self).__name__, name, device)
+
+    def mask_geometry(self, mask, effect):
+        """单个mask（窗口内）的边框几何，按内容哈希缓存
+
+        返回 {"expanded": 按距离扩展后的8位区域（CPU，无边框时为None），
+              "bbox": 物体+边框的边界框（窗口坐标，未加padding，空mask为None）}
+        """
+        border_width = effect[0]
+        key = (mask_digest(mask), "border", border_width)
+        geometry = _border_cache.get(key)
+        if geometry is not None:
+            return geometry
+
+        mask = mask.to(torch.float32)
+        expanded = None
+        full_mask = mask
+        if border_width > 0:
+            expanded = self.expand_masks(mask.unsqueeze(0), border_width)[0]
+            border_mask = self.border_from_expanded(expanded.to(mask.device), mask)
+            # 完整的mask（物体+边框）
+            full_mask = mask * mask + border_mask * (1 - mask)
+
+        geometry = {"expanded": expanded, "bbox": self.compute_bboxes(full_mask.unsqueeze(0), 0)[0]}
+        _border_cache.put(key, geometry)
+        return geometry
+
+    def render_chunk(self, image, mask, start, end, window, indices, geometries, effect, dtype):
+        """合成第 start 到 end 帧窗口内的RGBA结果：先放边框，再放物体（物体区域不透明，其他透明）"""
+        top, bottom, left, right = window
+        unique = list(geometries)
+        masks = mask[unique, top:bottom, left:right].to(device=image.device, dtype=dtype)
+
+        border_mask = None
+        if geometries[unique[0]]["expanded"] is not None:
+            expanded = torch.stack([geometries[index]["expanded"] for index in unique]).to(masks.device)
+            border_mask = self.gather_frames(self.border_from_expanded(expanded, masks), indices, unique)
+
+        images = image[start:end, top:bottom, left:right].to(dtype)
+        return self.composite_border(images, self.gather_frames(masks, indices, unique), border_mask, effect[1])
+
+    def gather_frames(self, values, indices, unique):
+        """把按不同mask计算的结果 values[k] 展开到每一帧；只有一个mask时不复制"""
+        if len(unique) == 1:
+            return values.expand((len(indices),) + tuple(values.shape[1:]))
+        position = {index: k for k, index in enumerate(unique)}
+        order = torch.tensor([position[index] for index in indices], device=values.device)
+        return values.index_select(0, order)
+
+    def expand_masks(self, masks, border_width):
+        """按到物体的欧氏距离扩展出边框区域，返回CPU上的8位结果
+        
+        距离从8位mask中所有非零像素（>= 1/255）算起，与原先对8位mask做灰度膨胀的外扩范围一致；
+        羽化/半透明的mask边缘也会外扩，边框范围和裁剪区域不会因为二值化阈值而缩小。
+        """
+        # 只把二值化的物体区域以uint8传到CPU
+        outside = (masks < BORDER_MASK_THRESHOLD).to(torch.uint8).cpu().numpy()
+        expanded = np.empty(outside.shape, dtype=np.uint8)
+        for i, frame in enumerate(outside):
+            # 一次精确距离变换，成本只与像素数有关，与边框宽度无关
+            distance = cv2.distanceTransform(frame, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+            # 距离不超过 border_width 完全覆盖，外缘一个像素线性过渡（抗锯齿）
+            np.subtract(border_width + 1, distance, out=distance)
+            np.clip(distance, 0, 1, out=distance)
+            expanded[i] = distance * 255 + 0.5
+        return torch.from_numpy(expanded)
+
+    def border_from_expanded(self, expanded, masks):
+        """边框mask：扩展区域减去原始区域（只要边框部分）"""
+        expanded = expanded.to(masks.dtype).div_(255)
+        return torch.maximum(expanded, masks).sub_(masks).clamp_(0, 1)
+
+    def composite_border(self, images, masks, border_mask, border_color):
+        """整批合成RGBA：边框层在下，带alpha的物体在上（与 Image.alpha_composite 一致）"""
+        rgb = images[..., :3] if images.shape[-1] >= 3 else images[..., :1].expand(-1, -1, -1, 3)
+        result = torch.empty(masks.shape + (4,), dtype=rgb.dtype, device=rgb.device)
+        # 展平成 [像素, 通道] 计算，比四维广播快得多
+        out = result.view(-1, 4)
+        out_rgb = out[:, :3]
+        pixels = rgb.reshape(-1, 3)
+        out[:, 3] = masks.reshape(-1)
+
+        if border_mask is None:
+            out_rgb.copy_(pixels)
+            return result
+
+        # 边框层是颜色按边框mask混合到透明背景上（Image.composite），
+        # 物体覆盖其上：alpha = a + b(1-a)，rgb = (rgb*a + color*b*b(1-a)) / alpha
+        # 权重只在单通道上计算；alpha为0处两个分子也为0，结果为0
+        uncovered = 1 - masks
+        alpha = torch.addcmul(masks, border_mask, uncovered)
+        inv_alpha = alpha.clamp_min(torch.finfo(alpha.dtype).tiny).reciprocal_()
+        object_weight = masks * inv_alpha
+        border_weight = (border_mask * border_mask).mul_(uncovered).mul_(inv_alpha)
+
+        color = torch.tensor(BORDER_COLORS[border_color], dtype=rgb.dtype, device=rgb.device)
+        torch.mul(pixels, object_weight.view(-1, 1), out=out_rgb)
+        out_rgb.addcmul_(border_weight.view(-1, 1), color.view(1, 3))
+        out[:, 3] = alpha.view(-1)
+        return result
+
+    def compute_bboxes(self, full_mask, crop_padding):
+        """逐帧计算加上padding后的边界框 (top, bottom, left, right)，空mask为None"""
+        batch_size, height, width = full_mask.shape
+        # 与原先对 (mask*255).astype(uint8) 调用 getbbox 一致：截断为8位后非零的像素
+        selected = full_mask >= BORDER_MASK_THRESHOLD
+        rows = selected.any(dim=2)
+        cols = selected.any(dim=1)
+
+        has_any = rows.any(dim=1).tolist()
+        top = rows.int().argmax(dim=1).tolist()
+        bottom = (height - rows.flip(1).int().argmax(dim=1)).tolist()
+        left = cols.int().argmax(dim=1).tolist()
+        right = (width - cols.flip(1).int().argmax(dim=1)).tolist()
+
+        boxes = []
+        for i in range(batch_size):
+            if not has_any[i]:
+                boxes.append(None)
+                continue
+            boxes.append((
+                max(0, top[i] - crop_padding),
+                min(height, bottom[i] + crop_padding),
+                max(0, left[i] - crop_padding),
+                min(width, right[i] + crop_padding),
+            ))
+        return boxes
+
+    def pad_box(self, box, padding, height, width):
+        """边界框向外扩展padding并限制在 height x width 内，None保持不变"""
+        if box is None:
+            return None
+        return (max(0, box[0] - padding), min(height, box[1] + padding),
+                max(0, box[2] - padding), min(width, box[3] + padding))
+
+    def compute_window(self, masks, margin):
+        """整批mask非零区域的并集边界框，向外扩展margin；mask全空时为None"""
+        support = (masks > 0).any(dim=0, keepdim=True).to(torch.float32)
+        return self.compute_bboxes(support, margin)[0]
+
+    def box_within(self, box, window):
+        """边界框是否完全位于窗口内"""
+        return box[0] >= window[0] and box[1] <= window[1] and box[2] >= window[2] and box[3] <= window[3]
+
+    def paste_regions(self, out, result, images, window, boxes, keep_rgb):
+        """把窗口内的RGBA结果按每帧边界框写入输出左上角；窗口外全透明，无边框时保留原图颜色"""
+        top, bottom, left, right = window
+        if len(set(boxes)) == 1:
+            groups = [(slice(None), boxes[0])]
+        else:
+            groups = [(slice(i, i + 1), box) for i, box in enumerate(boxes)]
+
+        for index, (box_top, box_bottom, box_left, box_right) in groups:
+            target = out[index]
+            if keep_rgb:
+                rgb = images[index, box_top:box_bottom, box_left:box_right]
+                rgb = rgb[..., :3] if rgb.shape[-1] >= 3 else rgb[..., :1]
+                target[:, :box_bottom - box_top, :box_right - box_left, :3] = rgb
+            # 边界框与窗口的交集
+            y0, y1 = max(box_top, top), min(box_bottom, bottom)
+            x0, x1 = max(box_left, left), min(box_right, right)
+            if y0 < y1 and x0 < x1:
+                target[:, y0 - box_top:y1 - box_top, x0 - box_left:x1 - box_left] = \
+                    result[index, y0 - top:y1 - top, x0 - left:x1 - left]
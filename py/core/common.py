@@ -0,0 +1,140 @@
+"""
+与ComfyUI无关的公共工具：延迟导入、批次裁剪、计算精度
+"""
+
+import time
+import importlib
+import json
+import torch
+import numpy as np
+
+# 延迟加载的模块首次使用时的导入耗时（秒）
+LAZY_IMPORT_TIMES = {}
+# 首次加载时是否打印耗时；离线批处理和基准测试的进程关闭，只记录到 LAZY_IMPORT_TIMES
+LAZY_IMPORT_VERBOSE = True
+
+class LazyModule:
+    """模块代理：首次访问属性时才导入，节点注册时不加载 cv2、torchvision 等重量级依赖
+
+    可以给出多个候选模块名，依次尝试导入。
+    """
+
+    def __init__(self, name, *fallbacks):
+        self._names = (name,) + fallbacks
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            start = time.perf_counter()
+            for i, name in enumerate(self._names):
+                try:
+                    module = importlib.import_module(name)
+                    break
+                except ImportError:
+                    if i == len(self._names) - 1:
+                        raise
+            elapsed = time.perf_counter() - start
+            LAZY_IMPORT_TIMES[self._names[0]] = elapsed
+            if LAZY_IMPORT_VERBOSE:
+                print(f"[Put-Tools] 首次使用时加载 {name}: {elapsed * 1000:.1f} ms")
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "已加载" if self._module is not None else "未加载"
+        return f"<LazyModule {self._names[0]} ({state})>"
+
+cv2 = LazyModule("cv2")
+T = LazyModule("torchvision.transforms.v2", "torchvision.transforms")
+Image = LazyModule("PIL.Image")
+ImageOps = LazyModule("PIL.ImageOps")
+ImageFilter = LazyModule("PIL.ImageFilter")
+
+# 批次裁剪模式：
+#   per_frame - 逐帧裁剪到各自的边界框（各帧尺寸需一致）
+#   union     - 所有帧共用边界框的并集，批次保持连续
+#   padded    - 逐帧裁剪后左上对齐、透明填充到同一尺寸，配合输出的边界框使用
+BATCH_CROP_MODES = ["per_frame", "union", "padded"]
+
+def union_box(boxes):
+    """多个 (top, bottom, left, right) 边界框的并集，忽略None；全为None时返回None"""
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return (
+        min(box[0] for box in boxes),
+        max(box[1] for box in boxes),
+        min(box[2] for box in boxes),
+        max(box[3] for box in boxes),
+    )
+
+def resolve_crop_boxes(boxes, mode, height, width):
+    """按批次裁剪模式确定每帧实际裁剪的边界框和输出尺寸，返回 (boxes, (out_height, out_width))
+
+    boxes 中的None表示该帧没有内容：per_frame 模式下保留整帧，其他模式下不参与并集，
+    padded 模式下该帧全透明、边界框尺寸为0。全部为None时保留整帧。
+    """
+    full_frame = (0, height, 0, width)
+    if union_box(boxes) is None:
+        return [full_frame] * len(boxes), (height, width)
+
+    if mode == "union":
+        box = union_box(boxes)
+        return [box] * len(boxes), (box[1] - box[0], box[3] - box[2])
+
+    if mode == "padded":
+        boxes = [box if box is not None else (0, 0, 0, 0) for box in boxes]
+        return boxes, (max(box[1] - box[0] for box in boxes), max(box[3] - box[2] for box in boxes))
+
+    boxes = [box if box is not None else full_frame for box in boxes]
+    sizes = {(box[1] - box[0], box[3] - box[2]) for box in boxes}
+    if len(sizes) > 1:
+        raise ValueError(f"各帧裁剪尺寸不一致 {sorted(sizes)}，请使用 union 或 padded 模式")
+    return boxes, sizes.pop()
+
+def paste_crops(out, images, boxes):
+    """把每帧边界框内的内容写入预分配输出的左上角，所有帧边界框相同时整批写入"""
+    if len(set(boxes)) == 1:
+        top, bottom, left, right = boxes[0]
+        out[:, :bottom - top, :right - left] = images[:, top:bottom, left:right]
+        return out
+    for i, (top, bottom, left, right) in enumerate(boxes):
+        out[i, :bottom - top, :right - left] = images[i, top:bottom, left:right]
+    return out
+
+def crop_batch(images, boxes, mode):
+    """按逐帧边界框裁剪 [B,H,W] 或 [B,H,W,C] 批次，返回 (结果, 每帧使用的边界框)
+
+    所有帧边界框相同时返回切片视图，否则写入新分配的输出（padded 模式以0填充）。
+    """
+    batch_size, height, width = images.shape[:3]
+    boxes, (out_height, out_width) = resolve_crop_boxes(boxes, mode, height, width)
+    if len(set(boxes)) == 1:
+        top, bottom, left, right = boxes[0]
+        return images[:, top:bottom, left:right], boxes
+
+    out = images.new_zeros((batch_size, out_height, out_width) + tuple(images.shape[3:]))
+    return paste_crops(out, images, boxes), boxes
+
+# 合成计算精度：float32 以外的选项只在GPU上生效，输出始终转换为 float32
+COMPUTE_DTYPES = ["float32", "float16", "bfloat16"]
+
+def resolve_compute_dtype(name, device):
+    """把 compute_dtype 选项转换为torch类型；CPU上半精度运算很慢，退回 float32"""
+    if name not in ("float16", "bfloat16") or torch.device(device).type == "cpu":
+        return torch.float32
+    return getattr(torch, name)
+
+def boxes_to_json(boxes, offset=(0, 0)):
+    """把边界框列表序列化为JSON：每帧内容在原图中的位置 x, y 和尺寸 width, height
+
+    offset 为边界框所在坐标系在原图中的 (y, x) 偏移。padded 模式下内容位于输出图像左上角。
+    """
+    offset_y, offset_x = offset
+    return json.dumps([
+        {"x": left + offset_x, "y": top + offset_y, "width": right - left, "height": bottom - top}
+        for top, bottom, left, right in boxes
+    ])
@@ -0,0 +1,182 @@
+"""
+多层描边/阴影：所有效果层来自同一次有向距离变换，一次合成
+"""
+
+import math
+from collections import namedtuple
+from .common import *
+from .border import BORDER_COLORS, BorderRenderer, mask_digest, _border_cache
+
+# 一个效果层：有向距离区间 (lo, hi]（像素，物体内部为负，lo为None表示整个内部），
+# 颜色（0-1浮点RGB）、不透明度、偏移（像素）、高斯模糊sigma、是否画在物体之上
+Layer = namedtuple("Layer", "lo hi color opacity dx dy blur above")
+
+DEFAULT_LAYERS = """[
+  {"range": [null, 12], "color": "black", "opacity": 0.5, "offset": [6, 6], "blur": 4},
+  {"range": [0, 12], "color": "white"},
+  {"range": [-2, 0], "color": "#ff4081"}
+]"""
+
+def parse_color(value):
+    """颜色名（white/black/gray）、"#rrggbb" 或 [r, g, b]（0-255）转为0-1浮点RGB"""
+    if isinstance(value, str):
+        if value in BORDER_COLORS:
+            return BORDER_COLORS[value]
+        text = value.lstrip("#")
+        if len(text) == 6:
+            return tuple(int(text[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    elif isinstance(value, (list, tuple)) and len(value) == 3:
+        return tuple(min(max(float(v), 0), 255) / 255 for v in value)
+    raise ValueError(f"无法识别的颜色: {value!r}")
+
+def parse_layers(text):
+    """解析效果层JSON列表，返回 Layer 元组（可哈希，用作缓存键）
+
+    每层字段：range [from, to]（默认 [0, 20]），color（默认 white），opacity（0-1，默认1），
+    offset [dx, dy]（默认 [0, 0]），blur（默认0），above（默认 to <= 0，即内描边画在物体之上）
+    """
+    text = text.strip()
+    if not text:
+        return ()
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("layers", [data])
+
+    layers = []
+    for item in data:
+        lo, hi = item.get("range", [0, 20])
+        if hi is None or (lo is not None and lo >= hi):
+            raise ValueError(f"效果层距离区间无效: {item.get('range')}")
+        dx, dy = item.get("offset", [0, 0])
+        blur = float(item.get("blur", 0))
+        if blur < 0:
+            raise ValueError(f"效果层模糊半径不能为负: {blur}")
+        layers.append(Layer(
+            lo=None if lo is None else float(lo),
+            hi=float(hi),
+            color=parse_color(item.get("color", "white")),
+            opacity=min(max(float(item.get("opacity", 1.0)), 0.0), 1.0),
+            dx=int(round(dx)),
+            dy=int(round(dy)),
+            blur=blur,
+            above=bool(item.get("above", hi <= 0)),
+        ))
+    return tuple(layers)
+
+def layers_reach(layers):
+    """效果层超出物体的最大距离（像素），含偏移、模糊和抗锯齿外缘"""
+    return 1 + max((math.ceil(max(layer.hi, 0) + max(abs(layer.dx), abs(layer.dy)) + 4 * layer.blur)
+                    for layer in layers), default=0)
+
+def shift_alpha(alpha, dx, dy):
+    """整数像素平移，移出的部分丢弃，空出的部分为0"""
+    if dx == 0 and dy == 0:
+        return alpha
+    height, width = alpha.shape
+    shifted = np.zeros_like(alpha)
+    if abs(dx) < width and abs(dy) < height:
+        shifted[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)] = \
+            alpha[max(-dy, 0):height - max(dy, 0), max(-dx, 0):width - max(dx, 0)]
+    return shifted
+
+class LayerRenderer(BorderRenderer):
+    """多层效果渲染（与ComfyUI无关，节点类在此基础上声明输入输出）"""
+
+    def apply_layers(self, image, mask, layers, auto_crop, crop_padding,
+                     batch_crop="per_frame", chunk_size=0, compute_dtype="float32"):
+        layers = parse_layers(layers)
+        return self.process_batch(image, mask, layers, layers_reach(layers), auto_crop, crop_padding,
+                                  batch_crop, chunk_size, compute_dtype)
+
+    def mask_geometry(self, mask, layers):
+        """单个mask（窗口内）所有效果层的alpha，按内容哈希缓存
+
+        返回 {"alphas": [层数, h, w] 8位alpha（CPU，已乘不透明度），
+              "bbox": 物体+所有效果层的边界框（窗口坐标，未加padding，空mask为None）}
+        """
+        key = (mask_digest(mask), "layers", layers)
+        geometry = _border_cache.get(key)
+        if geometry is not None:
+            return geometry
+
+        mask = mask.to(torch.float32)
+        signed = self.signed_distance(mask.cpu().numpy(), layers)
+        alphas = np.empty((len(layers),) + signed.shape, dtype=np.uint8)
+        for i, layer in enumerate(layers):
+            alphas[i] = self.layer_alpha(signed, layer) * 255 + 0.5
+        alphas = torch.from_numpy(alphas)
+
+        full_mask = mask
+        if len(layers):
+            full_mask = torch.maximum(alphas.amax(dim=0).to(mask.device, torch.float32) / 255, mask)
+        geometry = {"alphas": alphas, "bbox": self.compute_bboxes(full_mask.unsqueeze(0), 0)[0]}
+        _border_cache.put(key, geometry)
+        return geometry
+
+    def signed_distance(self, mask, layers):
+        """像素中心到物体边缘的有向距离（外正内负），与 MaskWhiteBorder 的边框距离一致
+
+        只有存在内部区间（边界为负）的层时才计算内部距离；半透明像素按覆盖率取亚像素距离。
+        """
+        inside = mask >= 0.5
+        signed = cv2.distanceTransform((~inside).astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+        signed -= 0.5
+        bounds = [bound for layer in layers for bound in (layer.lo, layer.hi) if bound is not None]
+        if min(bounds, default=0) < 0:
+            interior = cv2.distanceTransform(inside.astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+            signed[inside] = 0.5 - interior[inside]
+        else:
+            signed[inside] = -0.5
+        partial = (mask > 0) & (mask < 1)
+        signed[partial] = 0.5 - mask[partial]
+        return signed
+
+    def layer_alpha(self, signed, layer):
+        """距离区间 (lo, hi] 的覆盖率（两端各一个像素线性过渡），再平移、模糊并乘不透明度"""
+        alpha = np.clip(layer.hi + 0.5 - signed, 0, 1)
+        if layer.lo is not None:
+            alpha -= np.clip(layer.lo + 0.5 - signed, 0, 1)
+        alpha = shift_alpha(alpha, layer.dx, layer.dy)
+        if layer.blur > 0:
+            alpha = cv2.GaussianBlur(alpha, (0, 0), layer.blur, borderType=cv2.BORDER_REPLICATE)
+        return alpha * layer.opacity
+
+    def render_chunk(self, image, mask, start, end, window, indices, geometries, layers, dtype):
+        """合成第 start 到 end 帧窗口内的RGBA结果"""
+        top, bottom, left, right = window
+        unique = list(geometries)
+        device = image.device
+        masks = mask[unique, top:bottom, left:right].to(device=device, dtype=dtype)
+        alphas = torch.stack([geometries[index]["alphas"] for index in unique]).to(device).to(dtype).div_(255)
+
+        images = image[start:end, top:bottom, left:right]
+        rgb = images[..., :3] if images.shape[-1] >= 3 else images[..., :1].expand(-1, -1, -1, 3)
+        return self.composite_layers(rgb.to(dtype), self.gather_frames(masks, indices, unique),
+                                     self.gather_frames(alphas, indices, unique), layers)
+
+    def composite_layers(self, rgb, masks, alphas, layers):
+        """预乘alpha逐层 over 合成：物体之下的层 → 物体 → 物体之上的层，最后还原为直通alpha"""
+        result = torch.zeros(masks.shape + (4,), dtype=rgb.dtype, device=rgb.device)
+        # 展平成 [像素, 通道] 计算，比四维广播快得多
+        out = result.view(-1, 4)
+        out_rgb = out[:, :3]
+        out_alpha = out[:, 3]
+        pixels = rgb.reshape(-1, 3)
+
+        order = [k for k, layer in enumerate(layers) if not layer.above] + [None] + \
+                [k for k, layer in enumerate(layers) if layer.above]
+        for position, k in enumerate(order):
+            alpha = (masks if k is None else alphas[:, k]).reshape(-1)
+            if position > 0:
+                keep = 1 - alpha
+                out_rgb.mul_(keep.view(-1, 1))
+                out_alpha.mul_(keep)
+            out_alpha.add_(alpha)
+            if k is None:
+                out_rgb.addcmul_(pixels, alpha.view(-1, 1))
+            else:
+                color = torch.tensor(layers[k].color, dtype=rgb.dtype, device=rgb.device)
+                out_rgb.addcmul_(alpha.view(-1, 1), color.view(1, 3))
+
+        out_rgb.div_(out_alpha.clamp_min(torch.finfo(out_alpha.dtype).tiny).view(-1, 1))
+        return result
@@ -0,0 +1,217 @@
+"""
+分阶段计时和峰值内存统计：按 (节点, 阶段) 聚合为直方图，输出 Prometheus 文本格式
+
+环境变量 PUT_TOOLS_METRICS=0 关闭统计，关闭后 stage() 直接返回共享的空上下文，热路径上没有额外开销。
+"""
+
+import os
+import threading
+import time
+from contextlib import nullcontext
+import torch
+
+# 耗时直方图的桶上限（秒）
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# 峰值内存直方图的桶上限（字节），1MB 到 16GB 每级4倍
+BYTES_BUCKETS = tuple(1024 * 1024 * 4 ** i for i in range(8))
+# 阶段进行中时后台采样内存的间隔（秒）
+SAMPLE_INTERVAL = 0.005
+
+_NULL_STAGE = nullcontext()
+
+def _current_rss():
+    """进程当前常驻内存（字节），只支持 Linux 的 /proc，其他平台为None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class _MemorySampler:
+    """后台线程按固定间隔采样当前内存，更新所有进行中阶段的峰值
+
+    只读取当前用量，不重置 PyTorch 分配器的峰值统计，不影响其他代码（如 benchmark.py）
+    以及同一设备上同时进行的其他阶段。没有进行中的阶段时线程挂起。
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self._stages = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, stage):
+        with self._lock:
+            self._stages.add(stage)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="put_tools_metrics", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, stage):
+        with self._lock:
+            self._stages.discard(stage)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                stages = list(self._stages)
+                if not stages:
+                    self._wake.clear()
+                    continue
+            # 同一轮中相同设备只读取一次
+            readings = {}
+            for stage in stages:
+                if stage.device_key not in readings:
+                    readings[stage.device_key] = stage.read()
+                value = readings[stage.device_key]
+                if value is not None and value > stage.peak:
+                    stage.peak = value
+            time.sleep(self.interval)
+
+_sampler = _MemorySampler()
+
+class Histogram:
+    """累积直方图，每个桶记录不超过上限的观测数"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+class StageMetrics:
+    """各节点各阶段的耗时与峰值内存直方图
+
+    峰值内存为阶段内内存用量的最高值减去进入时的用量：CUDA 上采样PyTorch分配器的已分配内存
+    （阶段内刷新了分配器历史峰值时以该峰值为准），CPU 上采样进程常驻内存；
+    无法采样常驻内存的平台不记录CPU阶段的峰值。
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._seconds = {}
+        self._peak_bytes = {}
+        self._lock = threading.Lock()
+
+    def stage(self, node, name, device=None, sample_memory=True):
+        """计时上下文：with metrics.stage("IrregularCropper", "composite", image.device): ...
+
+        sample_memory=False 时只计时，不记录峰值内存：用于等待用户操作等长时间空闲的阶段，
+        避免后台线程在整个等待期间持续采样。
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, node, name, device, sample_memory)
+
+    def observe(self, node, name, seconds, peak_bytes=None):
+        key = (node, name)
+        with self._lock:
+            if key not in self._seconds:
+                self._seconds[key] = Histogram(SECONDS_BUCKETS)
+                self._peak_bytes[key] = Histogram(BYTES_BUCKETS)
+            self._seconds[key].observe(seconds)
+            if peak_bytes is not None:
+                self._peak_bytes[key].observe(peak_bytes)
+
+    def reset(self):
+        with self._lock:
+            self._seconds.clear()
+            self._peak_bytes.clear()
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            for metric, help_text, histograms in (
+                ("put_tools_stage_seconds", "各处理阶段的耗时（秒）", self._seconds),
+                ("put_tools_stage_peak_bytes", "各处理阶段的峰值内存增长（字节）", self._peak_bytes),
+            ):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for (node, name), histogram in sorted(histograms.items()):
+                    if histogram.count == 0:
+                        continue
+                    labels = f'node="{node}",stage="{name}"'
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        # repr 输出能精确还原的最短形式，字节桶上限不会被 :g 截断为6位有效数字
+                        lines.append(f'{metric}_bucket{{{labels},le="{float(bound)!r}"}} {count}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum:.6f}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+class _Stage:
+    """一个阶段的计时与峰值内存测量；多个阶段可以嵌套或在不同线程中同时进行
+
+    CUDA 上的运算是异步排队的，CUDA 阶段在进入和退出时同步设备，耗时包含阶段内排队的全部计算
+    （只在开启统计时同步）。
+    """
+
+    def __init__(self, metrics, node, name, device, sample_memory=True):
+        self.metrics = metrics
+        self.node = node
+        self.name = name
+        self.sample_memory = sample_memory
+        self.device = torch.device(device) if device is not None else None
+        self.cuda = self.device is not None and self.device.type == "cuda"
+        self.device_key = str(self.device) if self.cuda else "cpu"
+
+    def read(self):
+        if self.cuda:
+            return torch.cuda.memory_allocated(self.device)
+        return _current_rss()
+
+    def __enter__(self):
+        if self.cuda:
+            torch.cuda.synchronize(self.device)
+        self.base = self.peak = self.read() if self.sample_memory else None
+        if self.cuda:
+            self.allocator_peak = torch.cuda.max_memory_allocated(self.device)
+        if self.base is not None:
+            _sampler.add(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.cuda:
+            torch.cuda.synchronize(self.device)
+        seconds = time.perf_counter() - self.start
+        peak_bytes = None
+        if self.base is not None:
+            _sampler.remove(self)
+            peak = max(self.peak, self.read())
+            if self.cuda:
+                # 分配器历史峰值在阶段内被刷新时，说明阶段内的真实峰值就是它
+                allocator_peak = torch.cuda.max_memory_allocated(self.device)
+                if allocator_peak > self.allocator_peak:
+                    peak = max(peak, allocator_peak)
+            peak_bytes = max(0, peak - self.base)
+        self.metrics.observe(self.node, self.name, seconds, peak_bytes)
+        return False
+
+def render_gauges(groups):
+    """把 {前缀: {名称: 数值}} 形式的计数输出为 Prometheus gauge，非数值项忽略"""
+    lines = []
+    for prefix, values in groups.items():
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+metrics = StageMetrics(enabled=os.environ.get("PUT_TOOLS_METRICS", "1").lower() not in ("0", "false", "off", "no"))
+
+def stage(node, name, device=None, sample_memory=True):
+    """模块级快捷方式：metrics.stage(...)"""
+    return metrics.stage(node, name, device, sample_memory)
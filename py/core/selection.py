@@ -0,0 +1,652 @@
+"""
+选区几何与合成：多边形解析和简化、面积覆盖率光栅化、边缘平滑、裁剪和批量合成
+"""
+
+import re
+import torch.nn.functional as F
+from .common import *
+from .metrics import stage
+
+# 服务端路径简化的容差（原图像素）
+PATH_SIMPLIFY_TOLERANCE = 0.1
+# 距离场羽化的过渡带半宽与高斯半径之比，使两种平滑方式的边缘过渡宽度接近
+FEATHER_WIDTH_RATIO = 2.0
+# 分阶段统计中的节点名
+METRICS_NODE = "IrregularCropper"
+# edge_smooth 以前端预览图的像素为单位，预览图的默认最大边长
+PREVIEW_SIZE = 1024
+
+def edge_smooth_radius(edge_smooth, width, height, preview_size=PREVIEW_SIZE):
+    """把以预览图像素为单位的 edge_smooth 换算为原图像素的平滑半径（预览图只缩小不放大）"""
+    return edge_smooth / 2 * max(1.0, width / preview_size, height / preview_size)
+
+def parse_polygon(text):
+    """解析序列化的多边形，返回 [N,2] 原图像素坐标数组
+    
+    支持 JSON 点列表 [{"x": .., "y": ..}, ...] 或 [[x, y], ...]、{"points": [...]}，
+    以及紧凑格式 "x1,y1 x2,y2 ..."（任意空白/逗号/分号分隔的扁平数字序列）。
+    格式错误、坐标不是有限数值时抛出 ValueError。
+    """
+    text = text.strip()
+    if not text:
+        return np.zeros((0, 2), dtype=np.float64)
+    
+    try:
+        if text[0] in "[{":
+            data = json.loads(text)
+            if isinstance(data, dict):
+                data = data.get("points", data.get("path_points", []))
+            if not isinstance(data, list):
+                raise ValueError(f"应为点列表，实际为 {type(data).__name__}")
+            if data and isinstance(data[0], dict):
+                data = [(point["x"], point["y"]) for point in data]
+            values = np.asarray(data, dtype=np.float64)
+        else:
+            values = np.array([float(v) for v in re.split(r"[\s,;]+", text) if v], dtype=np.float64)
+    except KeyError as e:
+        raise ValueError(f"无法解析多边形: 点缺少 {e} 字段") from e
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"无法解析多边形: {e}") from e
+    
+    if values.ndim > 2 or (values.ndim == 2 and values.shape[1] != 2):
+        raise ValueError(f"多边形的点必须是 [x, y] 坐标对: {values.shape}")
+    if values.size % 2 != 0:
+        raise ValueError(f"多边形坐标数量必须为偶数: {values.size}")
+    if not np.isfinite(values).all():
+        raise ValueError("多边形坐标包含 NaN 或无穷大")
+    return values.reshape(-1, 2)
+
+def decode_path_points(buffer):
+    """把小端 float32 的 x,y 交替序列零拷贝解码为 [N,2] 数组"""
+    values = np.frombuffer(buffer, dtype="<f4")
+    if values.size % 2 != 0:
+        raise ValueError(f"路径坐标数量必须为偶数: {values.size}")
+    return values.reshape(-1, 2)
+
+def parse_path_points(path_points):
+    """解析JSON中的路径：[{"x": .., "y": ..}, ...] 或扁平的 [x1, y1, x2, y2, ...]"""
+    if not path_points:
+        return np.zeros((0, 2), dtype=np.float64)
+    if isinstance(path_points[0], dict):
+        return np.array([(point["x"], point["y"]) for point in path_points], dtype=np.float64)
+    return np.asarray(path_points, dtype=np.float64).reshape(-1, 2)
+
+def _douglas_peucker(points, tolerance):
+    """开放折线的 Douglas-Peucker 简化，保留首尾点"""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        
+        inner = points[start + 1:end] - points[start]
+        chord = points[end] - points[start]
+        length_sq = chord @ chord
+        if length_sq > 0:
+            t = np.clip(inner @ chord / length_sq, 0, 1)
+            inner = inner - t[:, None] * chord
+        distance = np.einsum("ij,ij->i", inner, inner)
+        
+        index = int(np.argmax(distance))
+        if distance[index] > tolerance * tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    
+    return points[keep]
+
+def simplify_path(points, tolerance):
+    """闭合路径的 Douglas-Peucker 简化：在离起点最远的点处分成两段分别简化"""
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) <= 3 or tolerance <= 0:
+        return points
+    
+    far = int(np.argmax(np.sum((points - points[0]) ** 2, axis=1)))
+    if far == 0:
+        return points
+    first = _douglas_peucker(points[:far + 1], tolerance)
+    second = _douglas_peucker(np.vstack([points[far:], points[:1]]), tolerance)
+    simplified = np.vstack([first, second[1:-1]])
+    return simplified if len(simplified) >= 3 else points
+
+# 覆盖率按行带累加，每带的 float64 差分缓冲区约为 带高 x 宽度 x 8 字节
+COVERAGE_BAND_ROWS = 256
+
+def _coverage_ramp(u):
+    """R(u) = ∫_0^u clamp(s, 0, 1) ds，用于计算线段右侧的像素覆盖面积"""
+    return np.where(u <= 0, 0.0, np.where(u < 1, 0.5 * u * u, u - 0.5))
+
+def _polygon_coverage(points, width, height):
+    """在 [0,width]x[0,height] 窗口内计算多边形的逐像素面积覆盖率
+    
+    每条边按扫描行切分，把线段右侧的有向面积累加到差分缓冲区，
+    再沿行做前缀和得到环绕数，计算量与多边形周长成正比。
+    按奇偶规则填充（与原先PIL绘制一致）：环绕数 w 取 |w| 对2的三角波，
+    自相交路径中被绕过两次的区域不填充。差分缓冲区按行带分配，内存只有输出本身加一个行带。
+    """
+    p0 = points
+    p1 = np.roll(points, -1, axis=0)
+    
+    # 在窗口左右边界处切分边，使每段要么在窗口内，要么整体在窗口外
+    dx = p1[:, 0] - p0[:, 0]
+    safe_dx = np.where(dx == 0, 1.0, dx)
+    ts = [np.zeros(len(p0)), np.ones(len(p0))]
+    for boundary in (0.0, float(width)):
+        t = (boundary - p0[:, 0]) / safe_dx
+        ts.append(np.where((dx != 0) & (t > 0) & (t < 1), t, 1.0))
+    ts = np.sort(np.stack(ts, axis=1), axis=1)
+    
+    t_start = ts[:, :-1].reshape(-1)
+    t_end = ts[:, 1:].reshape(-1)
+    base = np.repeat(p0, 3, axis=0)
+    delta = np.repeat(p1 - p0, 3, axis=0)
+    keep = t_end > t_start
+    a = base[keep] + delta[keep] * t_start[keep, None]
+    b = base[keep] + delta[keep] * t_end[keep, None]
+    
+    # 窗口外的段收缩到边界上，不影响窗口内的覆盖率
+    x0 = np.clip(a[:, 0], 0, width)
+    x1 = np.clip(b[:, 0], 0, width)
+    y0, y1 = a[:, 1], b[:, 1]
+    
+    # 水平边没有贡献；竖直方向裁剪到窗口内
+    keep = y0 != y1
+    x0, x1, y0, y1 = x0[keep], x1[keep], y0[keep], y1[keep]
+    direction = np.sign(y1 - y0)
+    slope = (x1 - x0) / (y1 - y0)
+    y_top = np.clip(np.minimum(y0, y1), 0, height)
+    y_bottom = np.clip(np.maximum(y0, y1), 0, height)
+    keep = y_bottom > y_top
+    x0, y0, slope, direction = x0[keep], y0[keep], slope[keep], direction[keep]
+    y_top, y_bottom = y_top[keep], y_bottom[keep]
+    
+    coverage = np.zeros((height, width), dtype=np.float32)
+    if len(x0) == 0:
+        return coverage
+    
+    # 按扫描行展开
+    row_start = np.floor(y_top).astype(np.int64)
+    row_count = np.ceil(y_bottom).astype(np.int64) - row_start
+    edge_idx = np.repeat(np.arange(len(x0)), row_count)
+    offsets = np.cumsum(row_count) - row_count
+    rows = row_start[edge_idx] + (np.arange(len(edge_idx)) - offsets[edge_idx])
+    
+    seg_y0 = np.maximum(y_top[edge_idx], rows)
+    seg_y1 = np.minimum(y_bottom[edge_idx], rows + 1)
+    seg_dy = (seg_y1 - seg_y0) * direction[edge_idx]
+    seg_xa = x0[edge_idx] + (seg_y0 - y0[edge_idx]) * slope[edge_idx]
+    seg_xb = x0[edge_idx] + (seg_y1 - y0[edge_idx]) * slope[edge_idx]
+    x_left = np.clip(np.minimum(seg_xa, seg_xb), 0, width)
+    x_right = np.clip(np.maximum(seg_xa, seg_xb), 0, width)
+    
+    # 按线段跨越的像素列展开，G(t) 为列边界 t 左侧被线段右侧区域覆盖的面积
+    col_start = np.floor(x_left).astype(np.int64)
+    col_count = np.floor(x_right).astype(np.int64) - col_start + 2
+    seg_idx = np.repeat(np.arange(len(rows)), col_count)
+    offsets = np.cumsum(col_count) - col_count
+    cols = col_start[seg_idx] + (np.arange(len(seg_idx)) - offsets[seg_idx])
+    
+    left = x_left[seg_idx]
+    right = x_right[seg_idx]
+    span = right - left
+    vertical = span < 1e-9
+    safe_span = np.where(vertical, 1.0, span)
+    
+    def covered(t):
+        sloped = (_coverage_ramp(t - left) - _coverage_ramp(t - right)) / safe_span
+        upright = np.clip(t - (left + right) / 2, 0, 1)
+        return np.where(vertical, upright, sloped)
+    
+    contribution = (covered(cols + 1.0) - covered(cols.astype(np.float64))) * seg_dy[seg_idx]
+    
+    stride = width + 2
+    flat = rows[seg_idx] * stride + cols
+    del seg_idx, cols, left, right, span, vertical, safe_span
+    # 按行带分组（带编号是小整数，稳定排序走基数排序），带内累加与顺序无关
+    band_rows = max(1, COVERAGE_BAND_ROWS)
+    band = (flat // (band_rows * stride)).astype(np.uint16 if height // band_rows < 65536 else np.int64)
+    order = np.argsort(band, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(band, minlength=(height + band_rows - 1) // band_rows))])
+    flat = flat[order]
+    contribution = contribution[order]
+    del order, band
+    
+    for band_index, band_start in enumerate(range(0, height, band_rows)):
+        band_end = min(height, band_start + band_rows)
+        lo, hi = bounds[band_index], bounds[band_index + 1]
+        if lo == hi:
+            continue
+        winding = np.bincount(flat[lo:hi] - band_start * stride, weights=contribution[lo:hi],
+                              minlength=(band_end - band_start) * stride)
+        winding = winding.reshape(band_end - band_start, stride)
+        np.cumsum(winding, axis=1, out=winding)
+        winding = winding[:, :width]
+        
+        # 奇偶规则：|w| mod 2 的三角波，部分覆盖的像素保持面积覆盖率
+        np.abs(winding, out=winding)
+        if winding.max() > 1 + 1e-9:  # 只有自相交重叠的行带需要折叠
+            np.mod(winding, 2, out=winding)
+            np.minimum(winding, 2 - winding, out=winding)
+        # 累加的舍入误差会在完全在外/完全在内的像素上留下极小的残差，
+        # 距离场羽化会把它们当成边缘像素，这里归零/归一
+        winding[winding < 1e-9] = 0
+        winding[winding > 1 - 1e-9] = 1
+        coverage[band_start:band_end] = winding
+    return coverage
+
+def rasterize_polygon_window(points, width, height, margin=0):
+    """只在多边形包围盒（外扩margin像素并限制在画面内）中光栅化
+    
+    返回 (patch, window)，window 为 (y_min, y_max, x_min, x_max)，patch 为该窗口内的
+    float32 覆盖率数组；多边形完全在画面外时返回 (None, None)。
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3:
+        return None, None
+    
+    x_min = max(0, int(np.floor(points[:, 0].min())) - margin)
+    x_max = min(width, int(np.ceil(points[:, 0].max())) + margin)
+    y_min = max(0, int(np.floor(points[:, 1].min())) - margin)
+    y_max = min(height, int(np.ceil(points[:, 1].max())) + margin)
+    if x_min >= x_max or y_min >= y_max:
+        return None, None
+    
+    local_points = points - np.array([x_min, y_min], dtype=np.float64)
+    patch = _polygon_coverage(local_points, x_max - x_min, y_max - y_min)
+    return patch, (y_min, y_max, x_min, x_max)
+
+def rasterize_polygon(points, width, height):
+    """解析面积覆盖率多边形光栅化，返回 [height, width] 的 float32 mask tensor
+    
+    points: [(x, y), ...] 或 [N,2] 数组，像素 i 覆盖区间 [i, i+1)。
+    只在多边形包围盒内分配和计算，自相交区域按奇偶规则填充。
+    """
+    patch, window = rasterize_polygon_window(points, width, height)
+    if window == (0, height, 0, width):
+        return torch.from_numpy(patch)
+    mask = torch.zeros((height, width), dtype=torch.float32)
+    if window is not None:
+        y_min, y_max, x_min, x_max = window
+        mask[y_min:y_max, x_min:x_max] = torch.from_numpy(patch)
+    return mask
+
+def _smooth_mask(mask, radius):
+    """对mask做高斯模糊平滑边缘"""
+    mask_image = Image.fromarray((mask * 255).round().astype(np.uint8), mode='L')
+    mask_image = mask_image.filter(ImageFilter.GaussianBlur(radius=radius))
+    return np.array(mask_image, dtype=np.float32) / 255.0
+
+def _feather_ramp(distance, half_width):
+    """把有向距离（内部为正）原地映射为 smoothstep 透明度过渡"""
+    t = distance
+    t += half_width
+    t *= 1.0 / (2 * half_width)
+    np.clip(t, 0, 1, out=t)
+    return t * t * (3 - 2 * t)
+
+def _feather_mask(mask, half_width):
+    """距离场羽化：按到选区边缘的有向距离（内部为正）生成透明度过渡
+    
+    距离由二值化后mask的距离变换得到，与羽化宽度无关，成本只与像素数成正比；
+    边缘上部分覆盖的像素直接用覆盖率估计亚像素距离，
+    因此解析光栅化的多边形边缘保持亚像素精度。
+    """
+    mask = mask.astype(np.float32, copy=False)
+    inside = (mask >= 0.5).astype(np.uint8)
+    distance_in = cv2.distanceTransform(inside, cv2.DIST_L2, 5)
+    distance_out = cv2.distanceTransform(1 - inside, cv2.DIST_L2, 5)
+    
+    # 内部: distance_in - 0.5；外部: 0.5 - distance_out
+    signed = distance_in - distance_out
+    signed -= inside
+    signed += 0.5
+    
+    partial = (mask > 0) & (mask < 1)
+    np.copyto(signed, mask - 0.5, where=partial)
+    return _feather_ramp(signed, half_width)
+
+def _smoothing_margin(smooth_radius, smooth_mode):
+    """平滑后mask超出原选区的最大距离"""
+    if smooth_radius <= 0:
+        return 0
+    if smooth_mode == "distance":
+        return int(np.ceil(smooth_radius * FEATHER_WIDTH_RATIO)) + 1
+    return int(np.ceil(smooth_radius * 3)) + 1
+
+def build_selection_mask(points, width, height, smooth_radius=0, auto_crop=False, crop_padding=0, smooth_mode="distance"):
+    """在原图分辨率下生成选区mask
+    
+    points 为原图像素坐标。只光栅化多边形包围盒外扩平滑半径（自动裁剪时再加上
+    crop_padding）的窗口，成本取决于选区大小而不是整帧大小。
+    smooth_mode 为 "distance" 时按到多边形边的有向距离羽化，"gaussian" 时做高斯模糊。
+    返回 (mask, crop_box)：自动裁剪成功时 mask 已是裁剪窗口内的部分，
+    crop_box 为其在原图中的位置；否则 mask 为整帧，crop_box 为 None。
+    """
+    margin = _smoothing_margin(smooth_radius, smooth_mode)
+    if auto_crop:
+        margin += crop_padding
+    
+    with stage(METRICS_NODE, "rasterize"):
+        patch, window = rasterize_polygon_window(points, width, height, margin)
+    if window is None:
+        return torch.zeros((height, width), dtype=torch.float32), None
+    y_min, y_max, x_min, x_max = window
+    
+    if smooth_radius > 0:
+        with stage(METRICS_NODE, "smooth"):
+            if smooth_mode == "distance":
+                patch = _feather_mask(patch, smooth_radius * FEATHER_WIDTH_RATIO)
+            else:
+                patch = _smooth_mask(patch, smooth_radius)
+    patch = torch.from_numpy(patch)
+    
+    if auto_crop:
+        # 窗口已包含全部 padding，在窗口内求得的裁剪框即为整帧上的裁剪框
+        with stage(METRICS_NODE, "crop"):
+            local_box = compute_crop_box(patch, crop_padding)
+        if local_box is not None:
+            top, bottom, left, right = local_box
+            crop_box = (y_min + top, y_min + bottom, x_min + left, x_min + right)
+            return crop_mask(patch, local_box), crop_box
+    
+    mask = torch.zeros((height, width), dtype=torch.float32)
+    mask[y_min:y_max, x_min:x_max] = patch
+    return mask, None
+
+def _prepare_mask(mask, width, height, smooth_radius=0, smooth_mode="distance"):
+    """把 [B,H,W] 的MASK转换为原图尺寸、取值在 [0,1] 内并平滑后的 float32 选区"""
+    mask = mask.float()
+    if tuple(mask.shape[-2:]) != (height, width):
+        with stage(METRICS_NODE, "resize", mask.device):
+            mask = F.interpolate(mask.unsqueeze(1), size=(height, width), mode="bilinear",
+                                 align_corners=False).squeeze(1)
+    mask = mask.clamp(0, 1)
+    
+    if smooth_radius > 0:
+        with stage(METRICS_NODE, "smooth"):
+            if smooth_mode == "distance":
+                half_width = smooth_radius * FEATHER_WIDTH_RATIO
+                smoothed = [_feather_mask(m.cpu().numpy(), half_width) for m in mask]
+            else:
+                smoothed = [_smooth_mask(m.cpu().numpy(), smooth_radius) for m in mask]
+            mask = torch.stack([torch.from_numpy(m) for m in smoothed]).to(mask.device)
+    return mask
+
+def build_selection_from_mask(mask, width, height, smooth_radius=0, auto_crop=False, crop_padding=0, smooth_mode="distance"):
+    """从已有的MASK生成选区，返回值与 build_selection_mask 相同
+    
+    mask 为 [B,H,W] 或 [H,W]，尺寸不一致时缩放到原图大小；单帧mask返回 [H,W]。
+    """
+    if mask.dim() == 2:
+        mask = mask.unsqueeze(0)
+    mask = _prepare_mask(mask, width, height, smooth_radius, smooth_mode)
+    
+    with stage(METRICS_NODE, "crop", mask.device):
+        crop_box = compute_crop_box(mask, crop_padding) if auto_crop else None
+    mask = crop_mask(mask, crop_box)
+    if mask.shape[0] == 1:
+        mask = mask[0]
+    return mask, crop_box
+
+def compute_crop_box(mask, padding, threshold=0.1):
+    """根据mask计算裁剪窗口 (y_min, y_max, x_min, x_max)，mask为空时返回None
+    
+    [B,H,W] 的mask按所有帧的并集计算
+    """
+    selected = mask > threshold
+    if selected.dim() == 3:
+        selected = selected.any(dim=0)
+    rows = torch.nonzero(selected.any(dim=1)).flatten()
+    cols = torch.nonzero(selected.any(dim=0)).flatten()
+    
+    if len(rows) == 0 or len(cols) == 0:
+        return None
+    
+    height, width = mask.shape[-2:]
+    y_min = max(0, int(rows[0]) - padding)
+    y_max = min(height, int(rows[-1]) + padding + 1)
+    x_min = max(0, int(cols[0]) - padding)
+    x_max = min(width, int(cols[-1]) + padding + 1)
+    return (y_min, y_max, x_min, x_max)
+
+def crop_mask(mask, crop_box):
+    """按裁剪窗口截取mask（支持[H,W]和[B,H,W]）"""
+    if crop_box is None:
+        return mask
+    y_min, y_max, x_min, x_max = crop_box
+    return mask[..., y_min:y_max, x_min:x_max]
+
+def crop_images(images, crop_box):
+    """按裁剪窗口截取[B,H,W,C]图像批次"""
+    if crop_box is None:
+        return images
+    y_min, y_max, x_min, x_max = crop_box
+    return images[:, y_min:y_max, x_min:x_max, :]
+
+# 不超过该半径时直接用 avg_pool2d（卷积核很小时比前缀和更快）
+BOX_BLUR_POOL_MAX_RADIUS = 1
+
+def _box_filter_1d(x, radius, dim, out):
+    """沿一个维度做盒式均值滤波：前缀和相减，每像素成本与半径无关，边界按实际像素数归一化
+    
+    原地计算：x 被改写为前缀和，结果写入同形状的 out 并返回，不分配新的整幅缓冲区。
+    """
+    size = x.shape[dim]
+    prefix = x.cumsum_(dim)
+    
+    # 窗口和 = prefix[min(i+r, size-1)] - prefix[i-r-1]（i-r-1 < 0 时为0），两段都是连续切片
+    head = max(0, size - radius)
+    if head:
+        out.narrow(dim, 0, head).copy_(prefix.narrow(dim, radius, head))
+    if size - head:
+        tail = out.narrow(dim, head, size - head)
+        tail.copy_(prefix.narrow(dim, size - 1, 1).expand_as(tail))
+    overlap = size - radius - 1
+    if overlap > 0:
+        out.narrow(dim, radius + 1, overlap).sub_(prefix.narrow(dim, 0, overlap))
+    
+    index = torch.arange(size, device=x.device)
+    counts = (index + radius + 1).clamp(max=size) - (index - radius).clamp(min=0)
+    shape = [1] * x.dim()
+    shape[dim] = size
+    return out.div_(counts.to(out.dtype).view(shape))
+
+def box_blur(images, radius, crop_box=None):
+    """[B,H,W,C] 批量盒式模糊，只计算 crop_box 窗口（外扩 radius 的邻域作为输入）"""
+    height, width = images.shape[1:3]
+    y_min, y_max, x_min, x_max = crop_box if crop_box is not None else (0, height, 0, width)
+    
+    # 邻域外扩radius，结果在窗口内与整帧计算一致
+    top, bottom = max(0, y_min - radius), min(height, y_max + radius)
+    left, right = max(0, x_min - radius), min(width, x_max + radius)
+    region = images[:, top:bottom, left:right, :]
+    # 前缀和用 float32 累加（半精度输入也提升到 float32）；相对误差约1e-5，8位输出中不可见
+    dtype = torch.float64 if images.dtype == torch.float64 else torch.float32
+    
+    if radius <= BOX_BLUR_POOL_MAX_RADIUS:
+        pooled = F.avg_pool2d(region.permute(0, 3, 1, 2).to(dtype).contiguous(), 2 * radius + 1, stride=1,
+                              padding=radius, count_include_pad=False)
+        blurred = pooled.permute(0, 2, 3, 1)
+    else:
+        # 两个缓冲区交替使用：第一遍 a → b，第二遍 b → a
+        a = region.to(dtype, copy=True)
+        b = torch.empty_like(a)
+        blurred = _box_filter_1d(_box_filter_1d(a, radius, 1, b), radius, 2, a)
+    blurred = blurred[:, y_min - top:y_max - top, x_min - left:x_max - left, :]
+    return blurred.to(images.dtype)
+
+def composite_batch(images, mask, background_fill, crop_box=None, blur_radius=4):
+    """批量合成：在输入张量所在设备上一次处理整个[B,H,W,C]批次
+    
+    images: [B,H,W,C]；mask 为所有帧共用的 [H,W] 或逐帧的 [B,H,W]，
+    crop_box 为 None 时是整帧，否则是裁剪窗口内的部分
+    """
+    device = images.device
+    mask = mask.to(device=device, dtype=images.dtype)
+    channels = images.shape[-1]
+    
+    blurred = None
+    if background_fill == "blur":
+        # 只在输出窗口内计算模糊背景
+        with stage(METRICS_NODE, "blur", device):
+            blurred = box_blur(images, blur_radius, crop_box)
+    
+    # 逐元素运算与裁剪可交换，先裁剪以减少计算量
+    images = crop_images(images, crop_box)
+    mask_4d = mask.unsqueeze(-1)
+    if mask_4d.dim() == 3:
+        mask_4d = mask_4d.unsqueeze(0)
+    
+    if background_fill == "transparent":
+        if channels == 3:
+            alpha_channel = mask_4d.expand(images.shape[0], -1, -1, 1)
+            return torch.cat([images, alpha_channel], dim=-1)
+        result = images.clone()
+        result[..., 3] = mask
+        return result
+    
+    if background_fill == "black":
+        return images * mask_4d
+    if background_fill == "white":
+        return images * mask_4d + (1 - mask_4d)
+    if background_fill == "blur":
+        return images * mask_4d + blurred * (1 - mask_4d)
+    return images.clone()
+
+def _frame_selections(mask, width, height, smooth_radius, crop_padding, smooth_mode, chunk):
+    """逐块准备逐帧mask，返回每帧在整帧上的裁剪框（没有内容的帧为None）和非零部分
+    
+    准备好的mask只保留非零值的包围盒 (box, patch)，包围盒外全为0，由它可以精确还原任意窗口。
+    """
+    boxes, patches = [], []
+    with stage(METRICS_NODE, "crop", mask.device):
+        for start in range(0, mask.shape[0], chunk):
+            prepared = _prepare_mask(mask[start:start + chunk], width, height, smooth_radius, smooth_mode)
+            for m in prepared:
+                boxes.append(compute_crop_box(m, crop_padding))
+                support = compute_crop_box(m, 0, threshold=0)
+                patches.append(support and (support, crop_mask(m, support).clone()))
+    return boxes, patches
+
+def _window_from_patches(patches, window, device):
+    """把逐帧的非零部分写入 [N,h,w] 的窗口（window 为整帧上的 (top, bottom, left, right)）"""
+    top, bottom, left, right = window
+    out = torch.zeros((len(patches), bottom - top, right - left), dtype=torch.float32, device=device)
+    for i, patch in enumerate(patches):
+        if patch is None:
+            continue
+        (y0, y1, x0, x1), values = patch
+        t, b, l, r = max(y0, top), min(y1, bottom), max(x0, left), min(x1, right)
+        if t < b and l < r:
+            out[i, t - top:b - top, l - left:r - left] = values[t - y0:b - y0, l - x0:r - x0]
+    return out
+
+def _apply_frame_masks(image, mask, background_fill, auto_crop, crop_padding, smooth_radius, smooth_mode,
+                       blur_radius, batch_crop, chunk, dtype):
+    """逐帧mask的分块处理：每块只准备自己的mask，准备时的中间结果随 chunk 而不是批次大小增长
+    
+    自动裁剪需要先知道所有帧的并集窗口，因此先逐块准备mask求出每帧的裁剪框，
+    只保留各帧的非零部分，合成时由它还原裁剪窗口内的mask。结果与整批处理相同。
+    """
+    batch_size, height, width, channels = image.shape
+    crop_box = None
+    if auto_crop:
+        frame_boxes, patches = _frame_selections(mask, width, height, smooth_radius, crop_padding,
+                                                 smooth_mode, chunk)
+        crop_box = union_box(frame_boxes)
+    
+    # 每帧在输出窗口（裁剪窗口或整帧）内的边界框
+    window = crop_box or (0, height, 0, width)
+    win_top, win_bottom, win_left, win_right = window
+    win_height, win_width = win_bottom - win_top, win_right - win_left
+    if crop_box is not None and batch_crop != "union":
+        # 整帧上的逐帧裁剪框都在并集窗口内，平移到窗口坐标即可
+        frame_boxes = [box and (box[0] - win_top, box[1] - win_top, box[2] - win_left, box[3] - win_left)
+                       for box in frame_boxes]
+        boxes, out_size = resolve_crop_boxes(frame_boxes, batch_crop, win_height, win_width)
+    else:
+        boxes, out_size = [(0, win_height, 0, win_width)] * batch_size, (win_height, win_width)
+    
+    out_channels = 4 if background_fill == "transparent" and channels == 3 else channels
+    result_image = torch.zeros((batch_size,) + out_size + (out_channels,), dtype=torch.float32, device=image.device)
+    result_mask = torch.zeros((batch_size,) + out_size, dtype=torch.float32, device=image.device)
+    # 合成阶段包含逐块的mask准备（resize、smooth 阶段单独统计）
+    with stage(METRICS_NODE, "composite", image.device):
+        for start in range(0, batch_size, chunk):
+            end = min(start + chunk, batch_size)
+            if auto_crop:
+                chunk_mask = _window_from_patches(patches[start:end], window, image.device)
+            else:
+                chunk_mask = _prepare_mask(mask[start:end], width, height, smooth_radius, smooth_mode)
+                chunk_mask = chunk_mask.to(image.device)
+            part = composite_batch(image[start:end].to(dtype), chunk_mask, background_fill, crop_box, blur_radius)
+            paste_crops(result_image[start:end], part, boxes[start:end])
+            paste_crops(result_mask[start:end], chunk_mask, boxes[start:end])
+    
+    return result_image, result_mask, boxes_to_json(boxes, (win_top, win_left))
+
+def apply_selection(image, background_fill, auto_crop, crop_padding, smooth_radius=0, points=None, mask=None,
+                    smooth_mode="distance", blur_radius=4, batch_crop="union", chunk_size=0, compute_dtype="float32"):
+    """执行 光栅化 → 合成 → 裁剪 流程，返回 (result_image, result_mask, crop_boxes)
+    
+    points 为原图像素坐标的多边形；提供 mask 时直接使用已有选区。
+    逐帧mask的选区各不相同时按 batch_crop 裁剪（见 BATCH_CROP_MODES），
+    crop_boxes 为每帧结果在原图中位置的JSON。
+    chunk_size 大于0时每次只合成这么多帧，结果写入预分配的输出；逐帧mask也按块准备。
+    compute_dtype 为合成使用的精度（见 COMPUTE_DTYPES），输出图像始终为 float32。
+    """
+    batch_size, height, width, channels = image.shape
+    dtype = resolve_compute_dtype(compute_dtype, image.device)
+    chunk = chunk_size if 0 < chunk_size < batch_size else batch_size
+    
+    if mask is not None:
+        if mask.dim() == 3 and mask.shape[0] != batch_size:
+            mask = mask[:1]
+        if mask.dim() == 3 and mask.shape[0] == batch_size > chunk:
+            return _apply_frame_masks(image, mask, background_fill, auto_crop, crop_padding, smooth_radius,
+                                      smooth_mode, blur_radius, batch_crop, chunk, dtype)
+        mask_tensor, crop_box = build_selection_from_mask(
+            mask, width, height, smooth_radius, auto_crop, crop_padding, smooth_mode
+        )
+    else:
+        mask_tensor, crop_box = build_selection_mask(
+            points, width, height, smooth_radius, auto_crop, crop_padding, smooth_mode
+        )
+    
+    # 整批处理：mask留在图像所在设备上
+    mask_tensor = mask_tensor.to(image.device)
+    result_mask = mask_tensor if mask_tensor.dim() == 3 else mask_tensor.unsqueeze(0)
+    
+    # 每帧在输出窗口（裁剪窗口或整帧）内的边界框
+    win_top, win_bottom, win_left, win_right = crop_box or (0, height, 0, width)
+    win_height, win_width = win_bottom - win_top, win_right - win_left
+    if crop_box is not None and batch_crop != "union" and result_mask.shape[0] > 1:
+        # 在并集窗口内按每帧自己的选区再裁剪
+        with stage(METRICS_NODE, "crop", image.device):
+            frame_boxes = [compute_crop_box(m, crop_padding) for m in result_mask]
+            boxes, out_size = resolve_crop_boxes(frame_boxes, batch_crop, win_height, win_width)
+            result_mask, _ = crop_batch(result_mask, frame_boxes, batch_crop)
+    else:
+        boxes, out_size = [(0, win_height, 0, win_width)] * batch_size, (win_height, win_width)
+    
+    # 合成阶段包含 blur 背景的模糊（blur 阶段单独统计）
+    with stage(METRICS_NODE, "composite", image.device):
+        if chunk == batch_size and set(boxes) == {(0, win_height, 0, win_width)} and dtype == image.dtype:
+            result_image = composite_batch(image, mask_tensor, background_fill, crop_box, blur_radius)
+        else:
+            # 分块按计算精度合成，直接写入预分配的 float32 输出
+            out_channels = 4 if background_fill == "transparent" and channels == 3 else channels
+            result_image = torch.zeros((batch_size,) + out_size + (out_channels,), dtype=torch.float32,
+                                       device=image.device)
+            for start in range(0, batch_size, chunk):
+                end = min(start + chunk, batch_size)
+                chunk_mask = mask_tensor[start:end] if mask_tensor.dim() == 3 else mask_tensor
+                part = composite_batch(image[start:end].to(dtype), chunk_mask, background_fill, crop_box,
+                                       blur_radius)
+                paste_crops(result_image[start:end], part, boxes[start:end])
+    
+    return result_image, result_mask, boxes_to_json(boxes, (win_top, win_left))
@@ -1,13 +1,459 @@
 from .md import *
-from PIL import ImageDraw, ImageFilter
-import weakref
-import gc
+from .core.selection import *
+from .core.metrics import metrics, render_gauges, stage
 import time
+import threading
+import hashlib
+import uuid
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import torch.nn.functional as F
 
-# 使用WeakKeyDictionary自动清理
-irregular_crop_node_data = weakref.WeakKeyDictionary()
-# 备用清理机制
-_node_data_by_id = {}
+# 前端预览图的默认最大边长（edge_smooth 以该尺寸下的像素为单位）
+MAX_PREVIEW_SIZE = PREVIEW_SIZE
+# 预览金字塔最大一级的边长，以及预览缓存的内存上限
+PREVIEW_BASE_SIZE = 2048
+PREVIEW_CACHE_MAX_BYTES = 128 * 1024 * 1024
+# 请求的预览尺寸向上取整到这些档位，不同像素比的请求落到同一份编码缓存
+PREVIEW_SIZE_STEPS = (256, 512, 1024, PREVIEW_BASE_SIZE)
+# 预览编码格式和质量，可被请求参数覆盖
+PREVIEW_FORMAT = "webp"
+PREVIEW_QUALITY = 85
+_PREVIEW_CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+# 选区重放缓存的内存上限
+SELECTION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 待处理会话的过期时间（秒）和内存上限
+SESSION_MAX_AGE = 300
+SESSION_MAX_BYTES = 4 * 1024 * 1024 * 1024
+# 节点等待前端操作的超时（秒）
+SESSION_WAIT_TIMEOUT = 60
+
+def _supports_async_nodes():
+    """ComfyUI 是否支持 async 节点函数；支持时多个节点的交互会话同时等待，而不是逐个阻塞执行线程"""
+    try:
+        import execution
+    except ImportError:
+        return False
+    return hasattr(execution, "_async_map_node_over_list")
+
+def _executing_prompt_id():
+    """正在执行本节点的任务ID，取自ComfyUI的执行上下文；旧版没有执行上下文时返回None
+    
+    PromptServer 的 last_prompt_id 是最近加入队列的任务，排队多个任务时并不是正在执行的那个。
+    """
+    try:
+        from comfy_execution.utils import get_executing_context
+    except ImportError:
+        return None
+    return getattr(get_executing_context(), "prompt_id", None)
+
+def snap_preview_size(max_size):
+    """取不小于请求尺寸的最小档位，超过最大档位时取最大档位"""
+    for size in PREVIEW_SIZE_STEPS:
+        if max_size <= size:
+            return size
+    return PREVIEW_SIZE_STEPS[-1]
+
+def _tensor_nbytes(value):
+    """估算缓存条目占用的字节数"""
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 0
+
+def _offload_tensor(value):
+    """缓存的张量移到内存；切片视图复制出来，不让缓存引用整块原始存储"""
+    if not isinstance(value, torch.Tensor):
+        return value
+    value = value.detach().cpu()
+    if value.untyped_storage().nbytes() > _tensor_nbytes(value):
+        value = value.clone()
+    return value
+
+def tensor_fingerprint(tensor, max_samples=1 << 20):
+    """图像内容的快速哈希：形状、类型加上元素内容
+    
+    元素不超过 max_samples 时哈希全部数据；更大的张量哈希均匀抽样的元素，
+    并加上每一行像素的总和与平方和（在张量所在设备上归约），抽样漏掉的像素改动也会改变哈希。
+    按行归约使 float32 累加的误差远小于8位像素的一级。
+    """
+    tensor = tensor.detach()
+    flat = tensor.reshape(-1)
+    step = max(1, flat.numel() // max_samples)
+    sample = flat[::step].contiguous().cpu().numpy()
+    
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{tuple(tensor.shape)}|{tensor.dtype}|{step}".encode())
+    digest.update(sample.tobytes())
+    if step > 1:
+        rows = tensor.reshape(tensor.shape[0] * tensor.shape[1], -1) if tensor.dim() > 2 else flat[None]
+        sums = rows.sum(dim=1, dtype=torch.float32)
+        norms = torch.linalg.vector_norm(rows, dim=1, dtype=torch.float32)
+        digest.update(torch.stack([sums, norms]).cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+class SelectionCache:
+    """按 (节点ID, 图像内容哈希, seed) 缓存已提交的选区路径和处理结果
+    
+    每个节点只保留最近一次提交，超出字节预算时按LRU淘汰。结果张量存放在内存中，
+    不占用显存，命中时由调用方搬回图像所在设备。
+    """
+    
+    def __init__(self, max_bytes=SELECTION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, key, entry):
+        size = sum(_tensor_nbytes(v) for v in entry.values())
+        if size > self.max_bytes:
+            return
+        entry = {name: _offload_tensor(value) for name, value in entry.items()}
+        entry["nbytes"] = size
+        
+        with self._lock:
+            node_id = key[0]
+            for old_key in [k for k in self._entries if k[0] == node_id]:
+                self._remove(old_key)
+            
+            self._entries[key] = entry
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+    
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry["nbytes"]
+
+_selection_cache = SelectionCache()
+
+class PreviewCache:
+    """预览图缓存：每个句柄保存逐级减半的缩略图金字塔及其编码结果，按LRU淘汰
+    
+    preferred_size 为前端最近一次请求对话框主预览图的尺寸档位（与屏幕像素比有关），
+    新会话在后台预先编码该尺寸，前端打开对话框时直接命中缓存。
+    """
+    
+    def __init__(self, max_bytes=PREVIEW_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.preferred_size = MAX_PREVIEW_SIZE
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def add(self, pil_image):
+        """登记一张预览图，返回前端获取图像用的句柄"""
+        handle = uuid.uuid4().hex
+        entry = {"handle": handle, "levels": [pil_image], "encoded": {}, "nbytes": self._image_bytes(pil_image)}
+        with self._lock:
+            self._entries[handle] = entry
+            self.total_bytes += entry["nbytes"]
+            self._evict(keep=handle)
+        return handle
+    
+    def discard(self, handle):
+        with self._lock:
+            if handle in self._entries:
+                self._remove(handle)
+    
+    def encode(self, handle, max_size, fmt=PREVIEW_FORMAT, quality=PREVIEW_QUALITY):
+        """按需要的分辨率返回编码后的图像字节，句柄不存在时返回None
+        
+        尺寸先取整到档位，再限制为不超过预览图本身，结果相同的请求共用一份编码。
+        """
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            self._entries.move_to_end(handle)
+            max_size = min(snap_preview_size(max_size), max(entry["levels"][0].size))
+            key = (max_size, fmt, quality)
+            if key in entry["encoded"]:
+                return entry["encoded"][key]
+        
+        with stage(METRICS_NODE, "preview_encode"):
+            level = self._level_for(entry, max_size)
+            if max(level.size) > max_size:
+                level = level.copy()
+                level.thumbnail((max_size, max_size), Image.LANCZOS)
+            
+            buffer = io.BytesIO()
+            if fmt == "webp":
+                level.save(buffer, format="WEBP", quality=quality, method=0)
+            elif fmt == "jpeg":
+                level.convert("RGB").save(buffer, format="JPEG", quality=quality)
+            else:
+                level.save(buffer, format="PNG", compress_level=1)
+            data = buffer.getvalue()
+        
+        with self._lock:
+            if self._entries.get(handle) is entry and key not in entry["encoded"]:
+                entry["encoded"][key] = data
+                entry["nbytes"] += len(data)
+                self.total_bytes += len(data)
+                self._evict(keep=handle)
+        return data
+    
+    def _level_for(self, entry, max_size):
+        """取不小于所需尺寸的最小一级，不够小时继续生成下一级
+        
+        缩放在锁外进行；放入金字塔前在锁内再检查一次，
+        其他线程已生成同一级时丢弃自己的结果，金字塔中不会出现重复的层级。
+        """
+        levels = entry["levels"]
+        while True:
+            with self._lock:
+                source = levels[-1]
+                count = len(levels)
+            if max(source.size) < max_size * 2 or min(source.size) <= 1:
+                break
+            width, height = source.size
+            level = source.resize((max(1, width // 2), max(1, height // 2)), Image.BOX)
+            with self._lock:
+                if len(levels) == count:
+                    levels.append(level)
+                    nbytes = self._image_bytes(level)
+                    entry["nbytes"] += nbytes
+                    if self._entries.get(entry["handle"]) is entry:
+                        self.total_bytes += nbytes
+        
+        with self._lock:
+            levels = list(levels)
+        for level in reversed(levels):
+            if max(level.size) >= max_size:
+                return level
+        return levels[0]
+    
+    def _evict(self, keep):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._remove(oldest)
+    
+    def _remove(self, handle):
+        entry = self._entries.pop(handle)
+        self.total_bytes -= entry["nbytes"]
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+    
+    @staticmethod
+    def _image_bytes(pil_image):
+        return pil_image.size[0] * pil_image.size[1] * len(pil_image.getbands())
+
+_previews = PreviewCache()
+# 预览编码线程池，避免占用节点线程和事件循环
+_preview_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="irregular_cropper_preview")
+# 提交选区后的光栅化和合成在单独的线程中逐个执行：不阻塞事件循环，多个会话同时提交时也不会叠加峰值内存
+_apply_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="irregular_cropper_apply")
+
+def prepare_preview(image, max_size=PREVIEW_BASE_SIZE):
+    """取第一帧并在其所在设备上缩小，之后才转换为uint8并传回CPU"""
+    frame = image[0].permute(2, 0, 1).unsqueeze(0)
+    height, width = frame.shape[-2:]
+    
+    scale = max_size / max(height, width)
+    if scale < 1:
+        size = (max(1, round(height * scale)), max(1, round(width * scale)))
+        frame = F.interpolate(frame.float(), size=size, mode="bilinear", align_corners=False, antialias=True)
+    
+    frame = (frame[0].clamp(0, 1) * 255).round().to(torch.uint8)
+    preview = frame.permute(1, 2, 0).cpu().numpy()
+    if preview.shape[-1] == 1:
+        preview = preview[..., 0]
+    return Image.fromarray(preview)
+
+def _resolve_waiter(future):
+    if not future.done():
+        future.set_result(True)
+
+class SessionEvent:
+    """会话结束信号，可从任意线程 set()
+    
+    同步执行时节点线程用 wait() 阻塞等待；async 执行时用 wait_async() 在执行器的事件循环中等待，
+    接口路由（服务器事件循环）通过 call_soon_threadsafe 唤醒，等待期间其他节点可以继续执行。
+    """
+    
+    def __init__(self):
+        self._event = threading.Event()
+        self._waiters = []
+        self._lock = threading.Lock()
+    
+    def is_set(self):
+        return self._event.is_set()
+    
+    def set(self):
+        with self._lock:
+            self._event.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve_waiter, future)
+            except RuntimeError:
+                pass  # 等待方的事件循环已关闭
+    
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+    
+    async def wait_async(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._event.is_set():
+                return True
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            with self._lock:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
+            return self._event.is_set()
+
+class SessionStore:
+    """等待前端操作的交互会话
+    
+    记录每个会话持有的字节数，按存活时间和总内存预算淘汰；淘汰时唤醒等待线程
+    并直接释放张量引用，不需要强制垃圾回收。
+    """
+    
+    def __init__(self, max_age=SESSION_MAX_AGE, max_bytes=SESSION_MAX_BYTES):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {
+            "created": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "timeout": 0,
+            "failed": 0,
+            "expired": 0,
+            "evicted": 0,
+            "replaced": 0,
+        }
+    
+    def __contains__(self, node_id):
+        return self.get(node_id) is not None
+    
+    def get(self, node_id):
+        with self._lock:
+            self._sweep()
+            return self._sessions.get(node_id)
+    
+    def create(self, node_id, **fields):
+        """创建会话；同一节点的旧会话会被替换并唤醒"""
+        session = dict(fields, node_id=node_id, session_id=uuid.uuid4().hex, event=SessionEvent(),
+                       timestamp=time.time(), nbytes=0)
+        session["nbytes"] = self._measure(session)
+        
+        with self._lock:
+            self._sweep()
+            if node_id in self._sessions:
+                self._drop(node_id, "replaced")
+            
+            self._sessions[node_id] = session
+            self.total_bytes += session["nbytes"]
+            self.counters["created"] += 1
+            
+            # 超出内存预算时从最旧的会话开始淘汰
+            while self.total_bytes > self.max_bytes and len(self._sessions) > 1:
+                oldest = next(iter(self._sessions))
+                if oldest == node_id:
+                    break
+                self._drop(oldest, "evicted")
+        return session
+    
+    def update(self, session, **fields):
+        """更新会话字段并重新计算占用的字节数"""
+        with self._lock:
+            session.update(fields)
+            nbytes = self._measure(session)
+            if self._sessions.get(session["node_id"]) is session:
+                self.total_bytes += nbytes - session["nbytes"]
+            session["nbytes"] = nbytes
+    
+    def release(self, node_id, session, reason):
+        """会话结束后释放；只释放仍属于该调用方的会话"""
+        with self._lock:
+            if self._sessions.get(node_id) is session:
+                self._drop(node_id, reason)
+            else:
+                self._clear(session)
+    
+    def pending(self, prompt_id=None):
+        """仍在等待前端操作的会话（按创建顺序），可按任务ID筛选
+        
+        不知道任务ID的会话（旧版ComfyUI）不参与筛选，总是包含在内。
+        """
+        with self._lock:
+            self._sweep()
+            return [
+                session for session in self._sessions.values()
+                if not session["event"].is_set() and (prompt_id is None or session.get("prompt_id") in (None, prompt_id))
+            ]
+    
+    def stats(self):
+        with self._lock:
+            self._sweep()
+            return {
+                "active_sessions": len(self._sessions),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                **self.counters,
+            }
+    
+    def _sweep(self):
+        now = time.time()
+        expired = [k for k, s in self._sessions.items() if now - s["timestamp"] > self.max_age]
+        for node_id in expired:
+            self._drop(node_id, "expired")
+    
+    def _drop(self, node_id, reason):
+        session = self._sessions.pop(node_id)
+        self.total_bytes -= session["nbytes"]
+        self.counters[reason] += 1
+        self._clear(session)
+        session["event"].set()
+    
+    @staticmethod
+    def _clear(session):
+        for key, value in session.items():
+            if isinstance(value, (torch.Tensor, np.ndarray)):
+                session[key] = None
+        session["nbytes"] = 0
+    
+    @staticmethod
+    def _measure(session):
+        return sum(_tensor_nbytes(v) for v in session.values())
+
+_sessions = SessionStore()
 
 class IrregularCropper:
     """异形图像裁剪节点 - 支持自由绘制和多边形选择"""
@@ -23,258 +469,345 @@ class IrregularCropper:
                 "auto_crop": ("BOOLEAN", {"default": True}),
                 "crop_padding": ("INT", {"default": 10, "min": 0, "max": 100, "step": 1}),
             },
+            "optional": {
+                # 前端seed控件的值，固定时重放上次的选区
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+                # 提供任一项时直接处理，不弹出交互界面；polygon 只接受连线，没有控件，
+                # 不会与旧工作流按序号恢复的控件值错位
+                "polygon": ("STRING", {"forceInput": True}),
+                "selection_mask": ("MASK",),
+                # distance: 按到选区边缘的距离羽化；gaussian: 高斯模糊
+                "smooth_mode": (["distance", "gaussian"], {"default": "distance"}),
+                # background_fill 为 blur 时的模糊半径（原图像素）
+                "blur_radius": ("INT", {"default": 4, "min": 1, "max": 256, "step": 1}),
+                # 逐帧mask时各帧选区不同的裁剪方式，默认所有帧共用并集窗口
+                "batch_crop": (BATCH_CROP_MODES, {"default": "union"}),
+                # 每次合成的帧数，0 表示整批一次处理；大批次时限制中间结果的内存
+                "chunk_size": ("INT", {"default": 0, "min": 0, "max": 4096, "step": 1}),
+                # 合成计算精度，GPU上可用半精度减少内存带宽
+                "compute_dtype": (COMPUTE_DTYPES, {"default": "float32"}),
+            },
             "hidden": {
                 "unique_id": "UNIQUE_ID",
             }
         }
 
-    RETURN_TYPES = ("IMAGE", "MASK")
-    RETURN_NAMES = ("裁剪图像", "选择区域")
-    FUNCTION = "irregular_crop"
+    RETURN_TYPES = ("IMAGE", "MASK", "STRING")
+    RETURN_NAMES = ("裁剪图像", "选择区域", "裁剪区域")
+    # 支持 async 节点的 ComfyUI 上，多个节点的交互会话可以同时等待，整个任务只需一次交互
+    FUNCTION = "irregular_crop_async" if _supports_async_nodes() else "irregular_crop"
     CATEGORY = "Put-Tools/Image"
 
-    def irregular_crop(self, image, crop_mode, background_fill, edge_smooth, auto_crop, crop_padding, unique_id):
-        node_id = unique_id
+    def irregular_crop(self, image, crop_mode, background_fill, edge_smooth, auto_crop, crop_padding, unique_id,
+                       **options):
+        session = self._open_session(image, crop_mode, background_fill, edge_smooth, auto_crop, crop_padding,
+                                     unique_id, **options)
+        if isinstance(session, tuple):
+            return session
         
+        answered = False
+        try:
+            with stage(METRICS_NODE, "wait", sample_memory=False):
+                answered = session["event"].wait(timeout=SESSION_WAIT_TIMEOUT)
+        finally:
+            result = self._close_session(session, image, answered)
+        return result
+    
+    async def irregular_crop_async(self, image, crop_mode, background_fill, edge_smooth, auto_crop, crop_padding,
+                                   unique_id, **options):
+        """async 执行：等待期间不占用执行线程，同一任务中其他节点的会话可以同时打开"""
+        session = self._open_session(image, crop_mode, background_fill, edge_smooth, auto_crop, crop_padding,
+                                     unique_id, **options)
+        if isinstance(session, tuple):
+            return session
+        
+        answered = False
+        try:
+            with stage(METRICS_NODE, "wait", sample_memory=False):
+                answered = await session["event"].wait_async(timeout=SESSION_WAIT_TIMEOUT)
+        finally:
+            result = self._close_session(session, image, answered)
+        return result
+    
+    def _open_session(self, image, crop_mode, background_fill, edge_smooth, auto_crop, crop_padding, node_id,
+                      seed=None, polygon="", selection_mask=None, smooth_mode="distance", blur_radius=4,
+                      batch_crop="union", chunk_size=0, compute_dtype="float32"):
+        """创建交互会话并通知前端；无界面模式、命中缓存或出错时直接返回结果元组"""
+        # 无界面模式：已有多边形或mask时直接处理，不等待前端
+        if selection_mask is not None or (polygon and polygon.strip()):
+            return self._crop_headless(image, polygon, selection_mask, background_fill, edge_smooth, auto_crop,
+                                       crop_padding, smooth_mode, blur_radius, batch_crop, chunk_size,
+                                       compute_dtype)
+        
+        # 相同图像和seed时重放上次提交的选区
+        settings = (background_fill, edge_smooth, auto_crop, crop_padding, smooth_mode, blur_radius, batch_crop,
+                    compute_dtype)
+        cache_key = None
+        if seed is not None:
+            try:
+                cache_key = (node_id, tensor_fingerprint(image), seed)
+                cached = self._replay_selection(cache_key, image, settings, chunk_size)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                print(f"[IrregularCropper] 选区缓存读取出错: {str(e)}")
+                traceback.print_exc()
+        
+        session = None
         try:
-            # 清理旧数据
-            self._cleanup_old_data()
-            
-            event = Event()
-            
             # 限制图像大小防止内存溢出
             batch_size, height, width, channels = image.shape
             max_size = 4096 * 4096
             if width * height > max_size:
                 print(f"[IrregularCropper] 警告: 图像过大 ({width}x{height})，可能导致内存问题")
             
-            # 使用较小的图像副本以节省内存
-            original_image = image.clone()
+            # 直接引用输入张量，不复制整批图像
+            session = _sessions.create(
+                node_id,
+                prompt_id=_executing_prompt_id(),
+                original_image=image,
+                result_image=None,
+                result_mask=None,
+                crop_boxes=None,
+                crop_mode=crop_mode,
+                background_fill=background_fill,
+                edge_smooth=edge_smooth,
+                smooth_mode=smooth_mode,
+                blur_radius=blur_radius,
+                batch_crop=batch_crop,
+                chunk_size=chunk_size,
+                compute_dtype=compute_dtype,
+                auto_crop=auto_crop,
+                crop_padding=crop_padding,
+                source_points=None,
+                settings=settings,
+                cache_key=cache_key,
+                preview_handle=None,
+            )
             
-            # 存储数据
-            node_data = {
-                "event": event,
-                "original_image": original_image,
-                "result_image": None,
-                "result_mask": None,
+            # 预览只发送句柄，前端按需要的分辨率通过GET接口获取二进制图像
+            with stage(METRICS_NODE, "preview", image.device):
+                pil_image = prepare_preview(image, PREVIEW_BASE_SIZE)
+                session["preview_handle"] = _previews.add(pil_image)
+            # 在后台线程预先编码默认尺寸，前端请求时直接命中缓存
+            _preview_executor.submit(_previews.encode, session["preview_handle"], _previews.preferred_size,
+                                     PREVIEW_FORMAT, PREVIEW_QUALITY)
+            
+            session["payload"] = {
+                "node_id": node_id,
+                "session_id": session["session_id"],
+                "prompt_id": session["prompt_id"],
+                "preview_handle": session["preview_handle"],
+                "preview_width": pil_image.size[0],
+                "preview_height": pil_image.size[1],
+                "preview_size": MAX_PREVIEW_SIZE,
                 "crop_mode": crop_mode,
                 "background_fill": background_fill,
                 "edge_smooth": edge_smooth,
                 "auto_crop": auto_crop,
-                "crop_padding": crop_padding,
-                "processing_complete": False,
-                "timestamp": time.time()
+                "crop_padding": crop_padding
             }
+            PromptServer.instance.send_sync("irregular_cropper_update", session["payload"])
+            return session
+        
+        except Exception as e:
+            print(f"[IrregularCropper] 节点执行出错: {str(e)}")
+            traceback.print_exc()
+            if session is not None:
+                self._close_session(session, image, False, "failed")
+            return self._passthrough(image)
+    
+    def _close_session(self, session, image, answered, reason=None):
+        """收集前端提交的结果并释放会话；取消、超时或出错时原样返回图像"""
+        node_id = session["node_id"]
+        try:
+            if reason is not None:
+                _sessions.release(node_id, session, reason)
+                return self._passthrough(image)
             
-            _node_data_by_id[node_id] = node_data
+            if not answered:
+                print(f"[IrregularCropper] 等待超时: 节点ID {node_id}")
+                _sessions.release(node_id, session, "timeout")
+                return self._passthrough(image)
             
-            # 发送预览图像
-            try:
-                preview_image = (torch.clamp(image.clone(), 0, 1) * 255).cpu().numpy().astype(np.uint8)[0]
-                pil_image = Image.fromarray(preview_image)
-                
-                # 限制预览图像大小
-                max_preview_size = (1024, 1024)
-                if pil_image.size[0] > max_preview_size[0] or pil_image.size[1] > max_preview_size[1]:
-                    pil_image.thumbnail(max_preview_size, Image.LANCZOS)
-                
-                buffer = io.BytesIO()
-                pil_image.save(buffer, format="PNG", optimize=True)
-                base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                
-                PromptServer.instance.send_sync("irregular_cropper_update", {
-                    "node_id": node_id,
-                    "image_data": f"data:image/png;base64,{base64_image}",
-                    "crop_mode": crop_mode,
-                    "background_fill": background_fill,
-                    "edge_smooth": edge_smooth,
-                    "auto_crop": auto_crop,
-                    "crop_padding": crop_padding
+            # 获取结果（会话被取消或淘汰时结果为None，原样返回）
+            result_image = session["result_image"]
+            result_mask = session["result_mask"]
+            crop_boxes = session["crop_boxes"]
+            if result_image is None or result_mask is None:
+                _sessions.release(node_id, session, "cancelled")
+                return self._passthrough(image)
+            
+            if session["cache_key"] is not None and session["source_points"] is not None:
+                _selection_cache.put(session["cache_key"], {
+                    "points": session["source_points"],
+                    "settings": session["settings"],
+                    "result_image": result_image,
+                    "result_mask": result_mask,
+                    "crop_boxes": crop_boxes,
                 })
-                
-                # 等待处理完成
-                if not event.wait(timeout=60):
-                    print(f"[IrregularCropper] 等待超时: 节点ID {node_id}")
-                    self._cleanup_node_data(node_id)
-                    return (image, torch.ones((1, image.shape[1], image.shape[2]), dtype=torch.float32))
-
-                # 获取结果
-                result_image = image
-                result_mask = torch.ones((1, image.shape[1], image.shape[2]), dtype=torch.float32)
-                
-                if node_id in _node_data_by_id:
-                    data = _node_data_by_id[node_id]
-                    if data["result_image"] is not None:
-                        result_image = data["result_image"]
-                    if data["result_mask"] is not None:
-                        result_mask = data["result_mask"]
-                
-                self._cleanup_node_data(node_id)
-                return (result_image, result_mask)
-                
-            except Exception as e:
-                print(f"[IrregularCropper] 处理过程中出错: {str(e)}")
-                traceback.print_exc()
-                self._cleanup_node_data(node_id)
-                return (image, torch.ones((1, image.shape[1], image.shape[2]), dtype=torch.float32))
             
+            _sessions.release(node_id, session, "completed")
+            return (result_image, result_mask, crop_boxes)
+        
         except Exception as e:
             print(f"[IrregularCropper] 节点执行出错: {str(e)}")
             traceback.print_exc()
-            self._cleanup_node_data(node_id)
-            return (image, torch.ones((1, image.shape[1], image.shape[2]), dtype=torch.float32))
+            _sessions.release(node_id, session, "failed")
+            return self._passthrough(image)
+        
+        finally:
+            if session["preview_handle"] is not None:
+                _previews.discard(session["preview_handle"])
+            # 通知前端移除该会话（已提交的会话前端早已移除，重复通知无副作用）
+            PromptServer.instance.send_sync("irregular_cropper_closed", {
+                "node_id": node_id,
+                "session_id": session["session_id"],
+            })
     
-    def _cleanup_node_data(self, node_id):
-        """清理指定节点的数据"""
-        if node_id in _node_data_by_id:
-            try:
-                data = _node_data_by_id[node_id]
-                # 清理大对象
-                if "original_image" in data:
-                    del data["original_image"]
-                if "result_image" in data:
-                    del data["result_image"]
-                if "result_mask" in data:
-                    del data["result_mask"]
-                del _node_data_by_id[node_id]
-            except Exception as e:
-                print(f"[IrregularCropper] 清理数据时出错: {str(e)}")
+    def _replay_selection(self, cache_key, image, settings, chunk_size=0):
+        """命中缓存时直接返回结果；只有处理参数变化时用缓存的路径重新计算"""
+        entry = _selection_cache.get(cache_key)
+        if entry is None:
+            return None
+        
+        if entry["settings"] == settings:
+            print(f"[IrregularCropper] 命中选区缓存: 节点ID {cache_key[0]}")
+            device = image.device
+            return (entry["result_image"].to(device), entry["result_mask"].to(device), entry["crop_boxes"])
         
-        # 强制垃圾回收
-        gc.collect()
+        background_fill, edge_smooth, auto_crop, crop_padding, smooth_mode, blur_radius, batch_crop, compute_dtype = settings
+        batch_size, height, width, channels = image.shape
+        smooth_radius = edge_smooth_radius(edge_smooth, width, height, MAX_PREVIEW_SIZE)
+        result_image, result_mask, crop_boxes = apply_selection(
+            image, background_fill, auto_crop, crop_padding, smooth_radius, points=entry["points"],
+            smooth_mode=smooth_mode, blur_radius=blur_radius, batch_crop=batch_crop, chunk_size=chunk_size,
+            compute_dtype=compute_dtype
+        )
+        _selection_cache.put(cache_key, {
+            "points": entry["points"],
+            "settings": settings,
+            "result_image": result_image,
+            "result_mask": result_mask,
+            "crop_boxes": crop_boxes,
+        })
+        print(f"[IrregularCropper] 重放缓存的选区: 节点ID {cache_key[0]}")
+        return (result_image, result_mask, crop_boxes)
     
-    def _cleanup_old_data(self):
-        """清理过期数据"""
-        current_time = time.time()
-        expired_keys = []
+    def _crop_headless(self, image, polygon, selection_mask, background_fill, edge_smooth, auto_crop, crop_padding,
+                       smooth_mode="distance", blur_radius=4, batch_crop="union", chunk_size=0,
+                       compute_dtype="float32"):
+        """无界面模式：直接执行 光栅化 → 合成 → 裁剪
+        
+        无人值守时原样返回图像就是悄无声息的错误结果，因此输入无效时抛出 ValueError 并指明是哪个输入，
+        不像交互模式那样退回原图。
+        """
+        batch_size, height, width, channels = image.shape
+        # 平滑半径与交互模式一致：按预览到原图的缩放换算
+        smooth_radius = edge_smooth_radius(edge_smooth, width, height, MAX_PREVIEW_SIZE)
         
-        for node_id, data in _node_data_by_id.items():
-            if current_time - data.get("timestamp", 0) > 300:  # 5分钟过期
-                expired_keys.append(node_id)
+        if selection_mask is not None:
+            if selection_mask.dim() not in (2, 3) or selection_mask.numel() == 0:
+                raise ValueError(f"selection_mask 输入无效: 应为 [H,W] 或 [B,H,W]，实际形状 {tuple(selection_mask.shape)}")
+            if not torch.isfinite(selection_mask).all():
+                raise ValueError("selection_mask 输入无效: 包含 NaN 或无穷大")
+            return apply_selection(image, background_fill, auto_crop, crop_padding, smooth_radius,
+                                   mask=selection_mask, smooth_mode=smooth_mode, blur_radius=blur_radius,
+                                   batch_crop=batch_crop, chunk_size=chunk_size,
+                                   compute_dtype=compute_dtype)
         
-        for key in expired_keys:
-            self._cleanup_node_data(key)
+        try:
+            points = parse_polygon(polygon)
+        except ValueError as e:
+            raise ValueError(f"polygon 输入无效: {e}") from e
+        if len(points) < 3:
+            raise ValueError(f"polygon 输入无效: 至少需要3个点，实际 {len(points)} 个")
+        return apply_selection(image, background_fill, auto_crop, crop_padding, smooth_radius,
+                               points=points, smooth_mode=smooth_mode, blur_radius=blur_radius,
+                               batch_crop=batch_crop, chunk_size=chunk_size,
+                               compute_dtype=compute_dtype)
+    
+    def _passthrough(self, image):
+        """取消、超时或出错时原样返回图像、全选mask和整帧裁剪区域"""
+        batch_size, height, width, channels = image.shape
+        return (image, torch.ones((1, height, width), dtype=torch.float32),
+                boxes_to_json([(0, height, 0, width)] * batch_size))
+
+def _find_session(data):
+    """按节点ID查找会话；请求带 session_id 时只接受同一会话，防止旧对话框的提交落到重新执行的节点上"""
+    session = _sessions.get(data.get("node_id"))
+    session_id = data.get("session_id")
+    if session is not None and session_id and session["session_id"] != session_id:
+        return None
+    return session
+
+def _apply_path(node_info, path_points, image_width, image_height):
+    """把预览坐标下的路径应用到会话的原图，返回 (结果图像, 结果mask, 裁剪区域, 原图坐标的路径)"""
+    original_image = node_info["original_image"]
+    batch_size, height, width, channels = original_image.shape
+    
+    # 把预览坐标映射到原图坐标，直接在原图分辨率下光栅化
+    scale_x = width / image_width
+    scale_y = height / image_height
+    source_points = path_points * np.array([scale_x, scale_y])
+    
+    # 在原图坐标下按容差简化路径，代替截断
+    with stage(METRICS_NODE, "simplify"):
+        source_points = simplify_path(source_points, PATH_SIMPLIFY_TOLERANCE)
+    
+    # 平滑半径以默认预览尺寸下的像素为单位，与实际获取的预览分辨率无关
+    smooth_radius = edge_smooth_radius(node_info["edge_smooth"], width, height, MAX_PREVIEW_SIZE)
+    with stage(METRICS_NODE, "apply_request", original_image.device):
+        result_image, result_mask, crop_boxes = apply_selection(
+            original_image, node_info["background_fill"], node_info["auto_crop"],
+            node_info["crop_padding"], smooth_radius, points=source_points,
+            smooth_mode=node_info["smooth_mode"], blur_radius=node_info["blur_radius"],
+            batch_crop=node_info["batch_crop"], chunk_size=node_info["chunk_size"],
+            compute_dtype=node_info["compute_dtype"]
+        )
+    return result_image, result_mask, crop_boxes, source_points
 
 @PromptServer.instance.routes.post("/irregular_cropper/apply")
 async def apply_irregular_cropper(request):
     try:
-        data = await request.json()
+        if request.content_type == "application/octet-stream":
+            # 紧凑格式：参数在查询字符串中，请求体为小端 float32 的 x,y 交替序列
+            data = request.query
+            body = await request.read()
+            with stage(METRICS_NODE, "decode"):
+                path_points = decode_path_points(body)
+        else:
+            data = await request.json()
+            with stage(METRICS_NODE, "decode"):
+                path_points = parse_path_points(data.get("path_points", []))
         node_id = data.get("node_id")
-        path_points = data.get("path_points", [])
-        image_width = data.get("image_width")
-        image_height = data.get("image_height")
-        
-        # 限制路径点数量
-        if len(path_points) > 2000:
-            path_points = path_points[:2000]
-            print(f"[IrregularCropper] 路径点过多，已限制为2000个点")
+        image_width = float(data.get("image_width"))
+        image_height = float(data.get("image_height"))
         
-        if node_id not in _node_data_by_id:
+        node_info = _find_session(data)
+        if node_info is None:
             print(f"[IrregularCropper] 节点数据未找到: {node_id}")
             return web.json_response({"success": False, "error": "节点数据未找到"})
         
         try:
-            node_info = _node_data_by_id[node_id]
-            original_image = node_info["original_image"]
-            
-            if path_points and len(path_points) >= 3:
-                batch_size, height, width, channels = original_image.shape
-                
-                # 使用4倍超采样实现抗锯齿
-                antialias_scale = 4
-                high_res_width = image_width * antialias_scale
-                high_res_height = image_height * antialias_scale
-                
-                # 创建高分辨率mask
-                mask_image = Image.new('L', (high_res_width, high_res_height), 0)
-                draw = ImageDraw.Draw(mask_image)
-                
-                # 转换坐标到高分辨率
-                polygon_points = []
-                for point in path_points:
-                    x = int(point['x'] * antialias_scale)
-                    y = int(point['y'] * antialias_scale)
-                    polygon_points.append((x, y))
-                
-                # 绘制高分辨率多边形
-                if len(polygon_points) >= 3:
-                    draw.polygon(polygon_points, fill=255)
-                
-                # 降采样到原始分辨率实现抗锯齿
-                mask_image = mask_image.resize((image_width, image_height), Image.LANCZOS)
-                
-                # 边缘平滑处理
-                if node_info["edge_smooth"] > 0:
-                    mask_image = mask_image.filter(ImageFilter.GaussianBlur(radius=node_info["edge_smooth"]/2))
+            if len(path_points) >= 3:
+                # 简化路径、光栅化和合成在线程池中执行，不阻塞事件循环；处理完成后才唤醒节点
+                loop = asyncio.get_running_loop()
+                result_image, result_mask, crop_boxes, source_points = await loop.run_in_executor(
+                    _apply_executor, _apply_path, node_info, path_points, image_width, image_height
+                )
+                if node_info["event"].is_set():
+                    # 处理期间会话已被取消、替换或超时，节点不会再读取结果
+                    print(f"[IrregularCropper] 会话已结束，丢弃结果: 节点ID {node_id}")
+                    return web.json_response({"success": False, "error": "会话已结束"})
                 
-                # 调整尺寸以匹配原始图像
-                if (image_width, image_height) != (width, height):
-                    mask_image = mask_image.resize((width, height), Image.LANCZOS)
-                
-                # 转换为tensor
-                mask_array = np.array(mask_image) / 255.0
-                mask_tensor = torch.from_numpy(mask_array).float()
-                
-                # 处理图像
-                processed_images = []
-                final_mask = mask_tensor
-                
-                for b in range(batch_size):
-                    img = original_image[b]
-                    
-                    if node_info["background_fill"] == "transparent":
-                        if channels == 3:
-                            alpha_channel = mask_tensor.unsqueeze(-1)
-                            img_result = torch.cat([img, alpha_channel], dim=-1)
-                        else:
-                            img_result = img.clone()
-                            img_result[:, :, 3] = mask_tensor
-                    else:
-                        img_result = img.clone()
-                        mask_3d = mask_tensor.unsqueeze(-1).expand_as(img)
-                        
-                        if node_info["background_fill"] == "black":
-                            img_result = img * mask_3d
-                        elif node_info["background_fill"] == "white":
-                            img_result = img * mask_3d + (1 - mask_3d)
-                        elif node_info["background_fill"] == "blur":
-                            # 简单模糊
-                            import torch.nn.functional as F
-                            img_blur = img.permute(2, 0, 1).unsqueeze(0)
-                            img_blur = F.avg_pool2d(img_blur, kernel_size=9, stride=1, padding=4)
-                            img_blur = img_blur.squeeze(0).permute(1, 2, 0)
-                            img_result = img * mask_3d + img_blur * (1 - mask_3d)
-                    
-                    # 自动裁剪
-                    if node_info["auto_crop"]:
-                        mask_np = mask_tensor.cpu().numpy()
-                        rows = np.any(mask_np > 0.1, axis=1)
-                        cols = np.any(mask_np > 0.1, axis=0)
-                        
-                        if rows.any() and cols.any():
-                            y_indices = np.where(rows)[0]
-                            x_indices = np.where(cols)[0]
-                            
-                            if len(y_indices) > 0 and len(x_indices) > 0:
-                                y_min, y_max = y_indices[0], y_indices[-1]
-                                x_min, x_max = x_indices[0], x_indices[-1]
-                                
-                                padding = node_info["crop_padding"]
-                                y_min = max(0, y_min - padding)
-                                y_max = min(height, y_max + padding + 1)
-                                x_min = max(0, x_min - padding)
-                                x_max = min(width, x_max + padding + 1)
-                                
-                                img_result = img_result[y_min:y_max, x_min:x_max, :]
-                                final_mask = mask_tensor[y_min:y_max, x_min:x_max]
-                    
-                    processed_images.append(img_result)
-                
-                result_image = torch.stack(processed_images)
-                result_mask = final_mask.unsqueeze(0)
-                
-                node_info["result_image"] = result_image
-                node_info["result_mask"] = result_mask
+                _sessions.update(
+                    node_info,
+                    result_image=result_image,
+                    result_mask=result_mask,
+                    crop_boxes=crop_boxes,
+                    source_points=source_points,
+                )
                 node_info["event"].set()
                 
                 print(f"[IrregularCropper] 处理完成，图像形状: {result_image.shape}")
@@ -287,8 +820,7 @@ async def apply_irregular_cropper(request):
         except Exception as e:
             print(f"[IrregularCropper] 处理数据时出错: {str(e)}")
             traceback.print_exc()
-            if node_id in _node_data_by_id:
-                _node_data_by_id[node_id]["event"].set()
+            node_info["event"].set()
             return web.json_response({"success": False, "error": str(e)})
 
     except Exception as e:
@@ -300,10 +832,19 @@ async def apply_irregular_cropper(request):
 async def cancel_irregular_crop(request):
     try:
         data = await request.json()
-        node_id = data.get("node_id")
         
-        if node_id in _node_data_by_id:
-            _node_data_by_id[node_id]["event"].set()
+        # 不带 node_id 时取消该任务（或全部）仍在等待的会话
+        if not data.get("node_id"):
+            cancelled = _sessions.pending(data.get("prompt_id"))
+            for session in cancelled:
+                session["event"].set()
+            print(f"[IrregularCropper] 取消全部操作: {len(cancelled)} 个会话")
+            return web.json_response({"success": True, "cancelled": len(cancelled)})
+        
+        node_id = data.get("node_id")
+        node_info = _find_session(data)
+        if node_info is not None:
+            node_info["event"].set()
             print(f"[IrregularCropper] 取消操作: 节点ID {node_id}")
             return web.json_response({"success": True})
         
@@ -314,6 +855,67 @@ async def cancel_irregular_crop(request):
         traceback.print_exc()
         return web.json_response({"success": False, "error": str(e)})
 
+@PromptServer.instance.routes.get("/irregular_cropper/pending")
+async def get_pending_irregular_crops(request):
+    """仍在等待选区的会话（与 irregular_cropper_update 事件内容相同），前端重新连接后据此恢复对话框"""
+    sessions = _sessions.pending(request.query.get("prompt_id"))
+    return web.json_response({"sessions": [session["payload"] for session in sessions if "payload" in session]})
+
+@PromptServer.instance.routes.get("/irregular_cropper/preview/{handle}")
+async def get_irregular_cropper_preview(request):
+    """按句柄返回二进制预览图，可选 max_size（取整到档位）/ format(webp|jpeg|png) / quality / primary 参数"""
+    try:
+        handle = request.match_info["handle"]
+        max_size = int(request.query.get("max_size", MAX_PREVIEW_SIZE))
+        max_size = max(16, min(max_size, PREVIEW_BASE_SIZE))
+        fmt = request.query.get("format", PREVIEW_FORMAT).lower()
+        if fmt not in _PREVIEW_CONTENT_TYPES:
+            fmt = PREVIEW_FORMAT
+        quality = max(1, min(int(request.query.get("quality", PREVIEW_QUALITY)), 100))
+        # 对话框主预览图的请求：记住尺寸档位，之后的会话预先编码该尺寸
+        if request.query.get("primary") and fmt == PREVIEW_FORMAT and quality == PREVIEW_QUALITY:
+            _previews.preferred_size = snap_preview_size(max_size)
+        
+        # 编码放到线程池中，避免阻塞事件循环
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(_preview_executor, _previews.encode, handle, max_size, fmt, quality)
+        if data is None:
+            return web.json_response({"success": False, "error": "预览图不存在或已过期"}, status=404)
+        
+        return web.Response(body=data, content_type=_PREVIEW_CONTENT_TYPES[fmt], headers={
+            "Cache-Control": "private, max-age=300",
+        })
+    
+    except Exception as e:
+        print(f"[IrregularCropper] 获取预览图出错: {str(e)}")
+        traceback.print_exc()
+        return web.json_response({"success": False, "error": str(e)}, status=500)
+
+@PromptServer.instance.routes.get("/irregular_cropper/stats")
+async def irregular_cropper_stats(request):
+    """会话和缓存的监控计数"""
+    return web.json_response({
+        "sessions": _sessions.stats(),
+        "selection_cache": _selection_cache.stats(),
+        "preview_cache": _previews.stats(),
+    })
+
+@PromptServer.instance.routes.get("/put_tools/metrics")
+async def put_tools_metrics(request):
+    """各节点分阶段耗时/峰值内存直方图和缓存计数，Prometheus 文本格式（PUT_TOOLS_METRICS=0 时关闭）"""
+    if not metrics.enabled:
+        return web.Response(text="# put-tools metrics disabled (PUT_TOOLS_METRICS=0)\n",
+                            content_type="text/plain")
+    from .core.border import _border_cache
+    text = metrics.render() + render_gauges({
+        "put_tools_sessions": _sessions.stats(),
+        "put_tools_selection_cache": _selection_cache.stats(),
+        "put_tools_preview_cache": _previews.stats(),
+        "put_tools_border_cache": _border_cache.stats(),
+    })
+    return web.Response(text=text, content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
 NODE_CLASS_MAPPINGS = {
     "IrregularCropper": IrregularCropper,
 }
@@ -0,0 +1,36 @@
+from .md import *
+from .core.layers import DEFAULT_LAYERS, LayerRenderer
+
+class MaskLayerEffects(LayerRenderer):
+    """多层描边/阴影：所有效果层来自同一次有向距离变换，一次合成"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "mask": ("MASK",),
+                # 效果层JSON列表，按顺序从下到上绘制
+                "layers": ("STRING", {"default": DEFAULT_LAYERS, "multiline": True}),
+                "auto_crop": ("BOOLEAN", {"default": True}),
+                "crop_padding": ("INT", {"default": 10, "min": 0, "max": 100, "step": 1}),
+            },
+            "optional": {
+                "batch_crop": (BATCH_CROP_MODES, {"default": "per_frame"}),
+                "chunk_size": ("INT", {"default": 0, "min": 0, "max": 4096, "step": 1}),
+                "compute_dtype": (COMPUTE_DTYPES, {"default": "float32"}),
+            }
+        }
+
+    RETURN_TYPES = ("IMAGE", "STRING")
+    RETURN_NAMES = ("image_with_layers", "crop_boxes")
+    FUNCTION = "apply_layers"
+    CATEGORY = "Put-Tools/Image"
+
+NODE_CLASS_MAPPINGS = {
+    "MaskLayerEffects": MaskLayerEffects,
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "MaskLayerEffects": "Mask多层描边/阴影",
+}
@@ -1,30 +1,23 @@
 """
 Put-Tools 核心依赖和工具函数
-提供ComfyUI节点开发所需的基础功能
+提供ComfyUI节点开发所需的基础功能，与ComfyUI无关的算法在 core 包中
 """
 
 import time
 import torch
 import numpy as np
-import cv2
 import os
 import sys
-import folder_paths
 import base64
 import io
+import json
 import traceback
 
-try:
-    import torchvision.transforms.v2 as T
-except ImportError:
-    import torchvision.transforms as T
-
 from aiohttp import web
-from PIL import Image, ImageOps
 from io import BytesIO
 from threading import Event
-from nodes import LoadImage, PreviewImage
 from server import PromptServer
+from .core.common import *
 
 routes = PromptServer.instance.routes
 
@@ -51,4 +44,4 @@ any = AnyType("*")
 __version__ = "1.0.0"
 __author__ = "Put-Tools Contributors"
 __email__ = ""
-__description__ = "ComfyUI异形图像处理工具集"
\ No newline at end of file
+__description__ = "ComfyUI异形图像处理工具集"
@@ -0,0 +1,18 @@
+"""
+测试只用到 py/core，不需要ComfyUI。
+
+与 benchmark.py 相同，把仓库作为 put_tools 包导入（不执行根目录 __init__.py 的节点注册）：
+仓库里的 py 包与 pytest 依赖的 py 模块同名，测试中不能直接 import py.core。
+"""
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 分阶段统计会在后台线程采样内存，测试中关闭
+os.environ.setdefault("PUT_TOOLS_METRICS", "0")
+
+package = types.ModuleType("put_tools")
+package.__path__ = [ROOT]
+sys.modules.setdefault("put_tools", package)
@@ -0,0 +1,88 @@
+"""
+边框和多层效果的合成与原先逐帧 PIL 合成（Image.composite + Image.alpha_composite）的结果一致
+"""
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from put_tools.py.core.border import BORDER_COLORS, BorderRenderer
+from put_tools.py.core.layers import Layer, LayerRenderer
+
+HEIGHT, WIDTH = 32, 40
+
+@pytest.fixture
+def planes():
+    """8位的图像、物体mask和边框mask；随机值覆盖所有半透明组合，再加上全透明/不透明的整行"""
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    mask = rng.integers(0, 256, (HEIGHT, WIDTH), dtype=np.uint8)
+    border = rng.integers(0, 256, (HEIGHT, WIDTH), dtype=np.uint8)
+    mask[:4] = 0
+    mask[4:8] = 255
+    border[:2] = 0
+    return image, mask, border
+
+def to_tensor(array):
+    return torch.from_numpy(array[None].astype(np.float64) / 255)
+
+def color_255(color):
+    return tuple(round(v * 255) for v in color)
+
+def pil_object(image, mask):
+    """原先的物体层：RGB图像以mask为alpha"""
+    layer = Image.fromarray(image).convert("RGBA")
+    layer.putalpha(Image.fromarray(mask, mode="L"))
+    return layer
+
+def pil_border(image, mask, border, color):
+    """原先 MaskWhiteBorder 的合成：边框颜色按边框mask混合到透明背景上，物体 alpha_composite 在上"""
+    size = (WIDTH, HEIGHT)
+    border_image = Image.new("RGBA", size, color_255(color) + (255,))
+    final = Image.composite(border_image, Image.new("RGBA", size, (0, 0, 0, 0)),
+                            Image.fromarray(border, mode="L"))
+    return np.array(Image.alpha_composite(final, pil_object(image, mask)), dtype=np.float64)
+
+def pil_layers(image, mask, alphas, layers):
+    """逐层 alpha_composite：物体之下的层 → 物体 → 物体之上的层"""
+    order = [k for k, layer in enumerate(layers) if not layer.above] + [None] + \
+            [k for k, layer in enumerate(layers) if layer.above]
+    canvas = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
+    for k in order:
+        if k is None:
+            layer = pil_object(image, mask)
+        else:
+            layer = Image.new("RGBA", (WIDTH, HEIGHT), color_255(layers[k].color) + (255,))
+            layer.putalpha(Image.fromarray(alphas[k], mode="L"))
+        canvas = Image.alpha_composite(canvas, layer)
+    return np.array(canvas, dtype=np.float64)
+
+@pytest.mark.parametrize("color", list(BORDER_COLORS))
+def test_composite_border_matches_pil(planes, color):
+    image, mask, border = planes
+    result = BorderRenderer().composite_border(to_tensor(image), to_tensor(mask), to_tensor(border), color)
+    expected = pil_border(image, mask, border, BORDER_COLORS[color])
+    # PIL 每步按8位取整，差异不超过1级
+    assert np.abs(result[0].numpy() * 255 - expected).max() <= 1
+
+def test_composite_border_without_border_keeps_pixels(planes):
+    image, mask, _ = planes
+    result = BorderRenderer().composite_border(to_tensor(image), to_tensor(mask), None, "white")
+    assert torch.equal(result[0, ..., :3], to_tensor(image)[0])
+    assert torch.equal(result[0, ..., 3], to_tensor(mask)[0])
+
+def test_composite_layers_matches_pil(planes):
+    image, mask, _ = planes
+    layers = (
+        Layer(lo=None, hi=12, color=(0.0, 0.0, 0.0), opacity=0.5, dx=6, dy=6, blur=4, above=False),
+        Layer(lo=0, hi=12, color=BORDER_COLORS["white"], opacity=1.0, dx=0, dy=0, blur=0, above=False),
+        Layer(lo=-2, hi=0, color=(1.0, 64 / 255, 129 / 255), opacity=1.0, dx=0, dy=0, blur=0, above=True),
+    )
+    rng = np.random.default_rng(1)
+    alphas = rng.integers(0, 256, (len(layers), HEIGHT, WIDTH), dtype=np.uint8)
+    alphas[:, :2] = 0
+
+    result = LayerRenderer().composite_layers(to_tensor(image), to_tensor(mask), to_tensor(alphas), layers)
+    expected = pil_layers(image, mask, alphas, layers)
+    # 每层合成 PIL 都取整一次，误差随层数累积
+    assert np.abs(result[0].numpy() * 255 - expected).max() <= 2
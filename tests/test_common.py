@@ -0,0 +1,60 @@
+"""
+批次裁剪：各 BATCH_CROP_MODES 模式下的边界框和输出尺寸
+"""
+import pytest
+import torch
+
+from put_tools.py.core.common import BATCH_CROP_MODES, crop_batch, resolve_crop_boxes
+
+HEIGHT, WIDTH = 20, 30
+
+@pytest.mark.parametrize("mode", BATCH_CROP_MODES)
+def test_all_empty_keeps_full_frame(mode):
+    boxes, size = resolve_crop_boxes([None, None], mode, HEIGHT, WIDTH)
+    assert boxes == [(0, HEIGHT, 0, WIDTH)] * 2
+    assert size == (HEIGHT, WIDTH)
+
+@pytest.mark.parametrize("mode", BATCH_CROP_MODES)
+def test_same_box_in_every_mode(mode):
+    box = (2, 12, 5, 25)
+    assert resolve_crop_boxes([box] * 3, mode, HEIGHT, WIDTH) == ([box] * 3, (10, 20))
+
+def test_union():
+    boxes, size = resolve_crop_boxes([(2, 10, 5, 15), None, (4, 18, 1, 9)], "union", HEIGHT, WIDTH)
+    assert boxes == [(2, 18, 1, 15)] * 3
+    assert size == (16, 14)
+
+def test_padded():
+    boxes, size = resolve_crop_boxes([(2, 10, 5, 15), None, (4, 18, 1, 9)], "padded", HEIGHT, WIDTH)
+    assert boxes == [(2, 10, 5, 15), (0, 0, 0, 0), (4, 18, 1, 9)]
+    assert size == (14, 10)
+
+def test_per_frame():
+    # 尺寸相同、位置不同的帧各自裁剪，没有内容的帧保留整帧
+    boxes, size = resolve_crop_boxes([(2, 10, 5, 15), (4, 12, 0, 10)], "per_frame", HEIGHT, WIDTH)
+    assert boxes == [(2, 10, 5, 15), (4, 12, 0, 10)]
+    assert size == (8, 10)
+    boxes, size = resolve_crop_boxes([None, (0, HEIGHT, 0, WIDTH)], "per_frame", HEIGHT, WIDTH)
+    assert boxes == [(0, HEIGHT, 0, WIDTH)] * 2
+
+def test_per_frame_rejects_different_sizes():
+    with pytest.raises(ValueError):
+        resolve_crop_boxes([(2, 10, 5, 15), (2, 11, 5, 15)], "per_frame", HEIGHT, WIDTH)
+    with pytest.raises(ValueError):
+        resolve_crop_boxes([(2, 10, 5, 15), None], "per_frame", HEIGHT, WIDTH)
+
+@pytest.mark.parametrize("mode", ["union", "padded"])
+def test_crop_batch_matches_boxes(mode):
+    images = torch.rand(3, HEIGHT, WIDTH, 4, generator=torch.Generator().manual_seed(0))
+    result, boxes = crop_batch(images, [(2, 10, 5, 15), None, (4, 18, 1, 9)], mode)
+    assert result.shape[1:3] == resolve_crop_boxes(boxes, mode, HEIGHT, WIDTH)[1]
+    for i, (top, bottom, left, right) in enumerate(boxes):
+        crop_height, crop_width = bottom - top, right - left
+        assert torch.equal(result[i, :crop_height, :crop_width], images[i, top:bottom, left:right])
+        # padded 模式下内容位于左上角，其余部分为0
+        assert not result[i, crop_height:].any() and not result[i, :, crop_width:].any()
+
+def test_crop_batch_same_box_returns_view():
+    images = torch.rand(2, HEIGHT, WIDTH)
+    result, _ = crop_batch(images, [(2, 10, 5, 15)] * 2, "per_frame")
+    assert result.data_ptr() == images[:, 2:, 5:].data_ptr()
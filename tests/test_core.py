@@ -0,0 +1,49 @@
+"""
+py/core 可以脱离ComfyUI单独导入和运行（离线批处理、cli.py 依赖这一点）
+"""
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# 在独立进程中按 README 的方式导入 py.core；ComfyUI 和服务端的模块一经导入即报错
+SMOKE_SCRIPT = """
+import importlib.abc
+import sys
+
+BLOCKED = {"server", "nodes", "folder_paths", "comfy", "comfy_execution", "comfy_extras", "execution", "aiohttp"}
+
+class BlockComfyUI(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path=None, target=None):
+        if name.split(".")[0] in BLOCKED:
+            raise ImportError(f"py.core 导入了 {name}")
+
+sys.meta_path.insert(0, BlockComfyUI())
+sys.path.insert(0, sys.argv[1])
+
+import json
+import torch
+from py.core import BorderRenderer, apply_selection
+
+image = torch.rand(2, 16, 20, 3)
+result, mask, boxes = apply_selection(image, "transparent", True, 1, smooth_radius=1,
+                                      points=[(3, 2), (15, 4), (9, 13)])
+assert result.shape[0] == 2 and result.shape[-1] == 4 and result.shape[1:3] == mask.shape[1:]
+assert len(json.loads(boxes)) == 2
+
+mask = torch.zeros(2, 16, 20)
+mask[:, 5:10, 6:12] = 1
+rgba, boxes = BorderRenderer().process_batch(image, mask, (2, "white"), 3, True, 1, "per_frame", 1, "float32")
+assert rgba.shape == (2, 11, 12, 4), rgba.shape
+assert json.loads(boxes)[0] == {"x": 3, "y": 2, "width": 12, "height": 11}
+
+loaded = sorted(name for name in sys.modules if name.split(".")[0] in BLOCKED)
+assert not loaded, loaded
+print("ok")
+"""
+
+def test_core_runs_without_comfyui():
+    completed = subprocess.run([sys.executable, "-c", SMOKE_SCRIPT, ROOT], cwd=ROOT, capture_output=True,
+                               text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip().endswith("ok")
@@ -0,0 +1,186 @@
+"""
+选区几何：面积覆盖率光栅化、盒式模糊、多边形和二进制路径的解析
+"""
+import json
+import struct
+
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from put_tools.py.core.common import BATCH_CROP_MODES
+from put_tools.py.core.selection import (
+    _polygon_coverage, apply_selection, box_blur, decode_path_points, parse_polygon, rasterize_polygon,
+)
+
+# 超采样参考中每个像素每个方向的采样数；直边穿过像素时参考值的误差不超过 1/SAMPLES
+SAMPLES = 32
+
+def supersampled_coverage(points, width, height, samples=SAMPLES):
+    """参考实现：在每个像素内均匀取 samples x samples 个点，按奇偶规则判断是否在多边形内"""
+    points = np.asarray(points, dtype=np.float64)
+    offsets = (np.arange(samples) + 0.5) / samples
+    xs = (np.arange(width)[:, None] + offsets).reshape(-1)
+    ys = (np.arange(height)[:, None] + offsets).reshape(-1)
+    px, py = np.meshgrid(xs, ys)
+
+    inside = np.zeros(px.shape, dtype=bool)
+    for (x0, y0), (x1, y1) in zip(points, np.roll(points, -1, axis=0)):
+        if y0 == y1:
+            continue
+        crosses = (y0 > py) != (y1 > py)
+        inside ^= crosses & (px < x0 + (py - y0) * (x1 - x0) / (y1 - y0))
+    return inside.reshape(height, samples, width, samples).mean(axis=(1, 3))
+
+def star(cx, cy, radius, points=5, step=2):
+    """正多角星：依次连接正多边形每隔 step 个的顶点，五角星中心被绕过两次"""
+    angles = np.pi / 2 + 2 * np.pi * step * np.arange(points) / points
+    return np.stack([cx + radius * np.cos(angles), cy - radius * np.sin(angles)], axis=1)
+
+def shoelace_area(points):
+    x, y = np.asarray(points, dtype=np.float64).T
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+CONVEX = [(4.3, 3.7), (30.2, 5.1), (41.6, 18.9), (33.4, 36.2), (9.8, 33.3), (2.5, 17.4)]
+SQUARE = [(8.5, 6.25), (30.75, 6.25), (30.75, 29.5), (8.5, 29.5)]
+
+def coverage_error(points, width=48, height=40):
+    coverage = _polygon_coverage(np.asarray(points, dtype=np.float64), width, height)
+    assert coverage.dtype == np.float32 and coverage.shape == (height, width)
+    return np.abs(coverage - supersampled_coverage(points, width, height))
+
+def test_polygon_coverage_matches_supersampling():
+    error = coverage_error(CONVEX)
+    assert error.max() <= 2 / SAMPLES
+    assert error.mean() < 1e-3
+
+def test_polygon_coverage_is_exact_area():
+    coverage = _polygon_coverage(np.asarray(CONVEX, dtype=np.float64), 48, 40)
+    assert coverage.sum(dtype=np.float64) == pytest.approx(shoelace_area(CONVEX), rel=1e-6)
+    assert coverage.min() >= 0 and coverage.max() <= 1
+
+@pytest.mark.parametrize("points, crossings", [
+    ([(5.2, 4.4), (40.7, 33.1), (40.3, 4.9), (5.6, 32.8)], 1),
+    (star(24.3, 20.7, 17.2), 5),
+])
+def test_self_intersecting_matches_supersampling(points, crossings):
+    # 覆盖率是先累加环绕数再取奇偶，只有边自相交点所在的像素会把两侧的环绕数平均掉
+    error = coverage_error(points)
+    assert (error > 2 / SAMPLES).sum() <= crossings
+    assert error.max() <= 0.5
+    assert error.mean() < 2e-3
+
+def test_self_intersecting_uses_even_odd_fill():
+    # 五角星中心被绕过两次，奇偶规则下不填充；两次绕行的正方形内部为空
+    coverage = _polygon_coverage(star(24.3, 20.7, 17.2), 48, 40)
+    assert coverage[20, 24] == 0
+    assert coverage[6, 24] == 1
+    coverage = _polygon_coverage(np.asarray(SQUARE + SQUARE), 48, 40)
+    assert not coverage[7:29, 9:30].any()
+
+def test_rasterize_clips_polygon_to_canvas():
+    points = [(-10.5, -4.2), (25.3, 3.1), (12.8, 50.6)]
+    mask = rasterize_polygon(points, 32, 24)
+    assert mask.shape == (24, 32) and mask.dtype == torch.float32
+    assert np.abs(mask.numpy() - supersampled_coverage(points, 32, 24)).max() <= 2 / SAMPLES
+
+def test_rasterize_outside_canvas_is_empty():
+    assert not rasterize_polygon([(40, 40), (60, 40), (50, 60)], 32, 24).any()
+
+def avg_pool_reference(images, radius):
+    """count_include_pad=False 的平均池化：边界按窗口内实际像素数归一化"""
+    pooled = F.avg_pool2d(images.permute(0, 3, 1, 2), 2 * radius + 1, stride=1, padding=radius,
+                          count_include_pad=False)
+    return pooled.permute(0, 2, 3, 1)
+
+@pytest.mark.parametrize("radius", [1, 2, 5, 40])
+@pytest.mark.parametrize("dtype, tolerance", [(torch.float64, 1e-12), (torch.float32, 1e-5)])
+def test_box_blur_matches_avg_pool(radius, dtype, tolerance):
+    # radius 1 走 avg_pool2d，更大的半径走前缀和；40 比图像还大
+    images = torch.rand(2, 23, 31, 3, generator=torch.Generator().manual_seed(radius), dtype=torch.float64)
+    expected = avg_pool_reference(images, radius)
+    result = box_blur(images.to(dtype), radius)
+    assert result.dtype == dtype and result.shape == images.shape
+    assert (result.double() - expected).abs().max() <= tolerance
+
+@pytest.mark.parametrize("radius", [1, 3, 9])
+def test_box_blur_window_matches_full_frame(radius):
+    images = torch.rand(3, 40, 36, 4, generator=torch.Generator().manual_seed(0), dtype=torch.float64)
+    crop_box = (5, 31, 2, 20)
+    y_min, y_max, x_min, x_max = crop_box
+    result = box_blur(images, radius, crop_box)
+    expected = avg_pool_reference(images, radius)[:, y_min:y_max, x_min:x_max]
+    assert result.shape == expected.shape
+    assert (result - expected).abs().max() <= 1e-12
+
+@pytest.mark.parametrize("batch_crop", BATCH_CROP_MODES)
+@pytest.mark.parametrize("auto_crop, smooth_radius", [(False, 0), (True, 0), (True, 3)])
+def test_frame_masks_chunked_match_whole_batch(batch_crop, auto_crop, smooth_radius):
+    # 分块时逐帧mask逐块准备，结果必须与整批准备一致；mask分辨率与图像不同，第3帧为空
+    images = torch.rand(5, 60, 64, 3, generator=torch.Generator().manual_seed(0))
+    masks = torch.zeros(5, 30, 32)
+    for i in range(5):
+        masks[i, 8 + i:14 + i, 8:17] = 1
+    masks[2] = 0
+    masks[3, 25:27, 22:27] = 0.05
+
+    def run(chunk_size):
+        return apply_selection(images, "blur", auto_crop, 2, smooth_radius, mask=masks, batch_crop=batch_crop,
+                               blur_radius=3, chunk_size=chunk_size)
+
+    if batch_crop == "per_frame" and auto_crop:
+        # 空帧保留整窗口，与其他帧尺寸不同
+        for chunk_size in (0, 2):
+            with pytest.raises(ValueError):
+                run(chunk_size)
+        masks[2] = masks[0].roll(6, dims=1)
+        masks[3, 25:27, 22:27] = 0
+    expected = run(0)
+    for chunk_size in (1, 2):
+        result = run(chunk_size)
+        assert torch.equal(result[0], expected[0]) and torch.equal(result[1], expected[1])
+        assert result[2] == expected[2]
+
+@pytest.mark.parametrize("text", [
+    json.dumps([{"x": 1, "y": 2}, {"x": 3.5, "y": 4}, {"x": 5, "y": 6}]),
+    json.dumps([[1, 2], [3.5, 4], [5, 6]]),
+    json.dumps({"points": [[1, 2], [3.5, 4], [5, 6]]}),
+    "1,2 3.5,4 5,6",
+    " 1 2;3.5 4\n5, 6 ",
+])
+def test_parse_polygon_formats(text):
+    assert parse_polygon(text).tolist() == [[1, 2], [3.5, 4], [5, 6]]
+
+def test_parse_polygon_empty():
+    assert parse_polygon("  ").shape == (0, 2)
+
+@pytest.mark.parametrize("text", [
+    "[[1, 2], [3, 4]",                       # JSON 不完整
+    "[[1, 2], [3]]",                         # 点的坐标数不一致
+    "[[1, 2, 3], [4, 5, 6]]",                # 不是坐标对
+    '[{"x": 1, "y": 2}, {"x": 3}]',          # 缺少字段
+    '[{"x": "a", "y": 2}]',                  # 坐标不是数字
+    '{"points": 5}',                         # 不是点列表
+    "1,2 3,4 5",                             # 坐标数量为奇数
+    "1,2 3,four 5,6",
+    "nan,1 2,3 4,5",                         # 非有限坐标
+    "[[1, null], [2, 3], [4, 5]]",
+    "[[1, 2], [3, 4], [1e400, 5]]",
+])
+def test_parse_polygon_rejects_malformed(text):
+    with pytest.raises(ValueError):
+        parse_polygon(text)
+
+def test_decode_path_points():
+    points = decode_path_points(struct.pack("<6f", 1, 2, 3.5, 4, 5, 6))
+    assert points.shape == (3, 2) and points.dtype == np.float32
+    assert points.tolist() == [[1, 2], [3.5, 4], [5, 6]]
+
+@pytest.mark.parametrize("buffer", [
+    struct.pack("<3f", 1, 2, 3),             # 坐标数量为奇数
+    struct.pack("<4f", 1, 2, 3, 4)[:-1],     # 长度不是 float32 的整数倍
+])
+def test_decode_path_points_rejects_malformed(buffer):
+    with pytest.raises(ValueError):
+        decode_path_points(buffer)
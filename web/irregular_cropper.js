@@ -22,7 +22,7 @@ function getOrCreateIrregularCropperModal() {
     modal.innerHTML = `
         <div class="irregular-cropper-container">
             <div class="irregular-cropper-header">
-                <h3>异形图像裁剪</h3>
+                <h3 class="irregular-cropper-title">异形图像裁剪</h3>
                 <div class="mode-selector">
                     <label>
                         <input type="radio" name="drawing-mode" value="polygon" checked>
@@ -33,11 +33,15 @@ function getOrCreateIrregularCropperModal() {
                         自由绘制
                     </label>
                 </div>
-                <button class="close-button">×</button>
+                <button class="close-button" title="关闭并取消全部">×</button>
             </div>
+            <div class="irregular-cropper-filmstrip"></div>
             <div class="irregular-cropper-content">
                 <div class="irregular-cropper-wrapper">
-                    <canvas id="irregular-crop-canvas"></canvas>
+                    <div class="irregular-crop-stage">
+                        <img class="irregular-crop-image" draggable="false">
+                        <canvas id="irregular-crop-canvas"></canvas>
+                    </div>
                     <div class="drawing-controls">
                         <button id="undo-point">撤销点</button>
                         <button id="clear-path">清除路径</button>
@@ -45,6 +49,7 @@ function getOrCreateIrregularCropperModal() {
                     </div>
                 </div>
                 <div class="irregular-cropper-controls">
+                    <button id="cancel-all-irregular-crop">全部取消</button>
                     <button id="apply-irregular-crop">应用裁剪</button>
                     <button id="cancel-irregular-crop">取消</button>
                 </div>
@@ -128,6 +133,47 @@ function ensureIrregularCropperStyles() {
             cursor: pointer;
         }
         
+        .irregular-cropper-filmstrip {
+            display: flex;
+            gap: 8px;
+            padding: 10px 20px;
+            background: #262626;
+            border-bottom: 1px solid #444;
+            overflow-x: auto;
+        }
+        
+        .filmstrip-item {
+            display: flex;
+            flex-direction: column;
+            align-items: center;
+            gap: 4px;
+            padding: 4px;
+            border: 2px solid transparent;
+            border-radius: 4px;
+            background: #333;
+            color: #ccc;
+            font-size: 11px;
+            cursor: pointer;
+            flex: none;
+        }
+        
+        .filmstrip-item img {
+            width: 80px;
+            height: 60px;
+            object-fit: contain;
+            background: #1a1a1a;
+        }
+        
+        .filmstrip-item.active {
+            border-color: #2a8af6;
+            color: #fff;
+        }
+        
+        .filmstrip-item.has-path span::after {
+            content: " ●";
+            color: #00ff00;
+        }
+        
         .irregular-cropper-content {
             padding: 20px;
             display: flex;
@@ -145,12 +191,28 @@ function ensureIrregularCropperStyles() {
             gap: 15px;
         }
         
-        #irregular-crop-canvas {
+        /* 图像作为静态背景层，路径画在透明的覆盖画布上，绘制时不再重绘图像 */
+        .irregular-crop-stage {
+            position: relative;
+            max-width: 100%;
+            line-height: 0;
+            border: 1px solid #555;
+        }
+        
+        .irregular-crop-image {
+            display: block;
             max-width: 100%;
             max-height: 70vh;
-            object-fit: contain;
+            user-select: none;
+            pointer-events: none;
+        }
+        
+        #irregular-crop-canvas {
+            position: absolute;
+            inset: 0;
+            width: 100%;
+            height: 100%;
             cursor: crosshair;
-            border: 1px solid #555;
         }
         
         .drawing-controls {
@@ -191,11 +253,16 @@ function ensureIrregularCropperStyles() {
             color: white;
         }
         
-        #cancel-irregular-crop {
+        #cancel-irregular-crop,
+        #cancel-all-irregular-crop {
             background: #666;
             color: white;
         }
         
+        #cancel-all-irregular-crop {
+            margin-right: auto;
+        }
+        
         .irregular-cropper-controls button:hover {
             opacity: 0.9;
         }
@@ -216,7 +283,13 @@ class IrregularCropper {
         this.drawingMode = "polygon";
         this.currentPath = [];
         this.pathClosed = false;
-        this.originalImageData = null;
+        this.image = null;
+        // 自由绘制中已画到覆盖画布上的点数，新增的点只补画之后的线段
+        this.drawnStrokeLength = 0;
+
+        // 待处理的会话（按到达顺序），同一任务中多个节点的选区在一次对话框中依次完成
+        this.sessions = new Map();
+        this.activeSessionId = null;
 
         // 添加内存管理
         this.maxImageSize = 4096 * 4096;
@@ -230,6 +303,7 @@ class IrregularCropper {
 
         ensureIrregularCropperStyles();
         this.modal = getOrCreateIrregularCropperModal();
+        this.image = this.modal.querySelector(".irregular-crop-image");
         this.canvas = this.modal.querySelector("#irregular-crop-canvas");
         this.ctx = this.canvas.getContext("2d");
 
@@ -247,11 +321,14 @@ class IrregularCropper {
         }
 
         const closeButton = this.modal.querySelector(".close-button");
-        closeButton.addEventListener("click", () => this.cleanupAndClose(true));
+        closeButton.addEventListener("click", () => this.cancelAll());
 
         const cancelButton = this.modal.querySelector("#cancel-irregular-crop");
         cancelButton.addEventListener("click", () => this.cleanupAndClose(true));
 
+        const cancelAllButton = this.modal.querySelector("#cancel-all-irregular-crop");
+        cancelAllButton.addEventListener("click", () => this.cancelAll());
+
         const applyButton = this.modal.querySelector("#apply-irregular-crop");
         applyButton.addEventListener("click", () => this.applyIrregularCrop());
 
@@ -274,7 +351,7 @@ class IrregularCropper {
 
         this.modal.addEventListener("keydown", (e) => {
             if (e.key === "Escape") {
-                this.cleanupAndClose(true);
+                this.cancelAll();
             }
         });
 
@@ -311,6 +388,7 @@ class IrregularCropper {
         } else if (this.drawingMode === "free_draw") {
             this.isDrawing = true;
             this.currentPath = [coords];
+            this.drawnStrokeLength = 0;
         }
     }
 
@@ -320,10 +398,7 @@ class IrregularCropper {
             // 限制路径点数量防止内存溢出，但保持足够的精度
             if (this.currentPath.length < 8000) {
                 this.currentPath.push(coords);
-                // 适当的重绘频率
-                if (this.currentPath.length % 4 === 0) {
-                    this.redrawCanvas();
-                }
+                this.drawStrokeIncrement();
             }
         }
     }
@@ -421,18 +496,40 @@ class IrregularCropper {
         });
     }
 
+    // 自由绘制时只补画上一帧之后新增的线段，成本与新增点数有关，与图像尺寸和已有路径长度无关
+    drawStrokeIncrement() {
+        if (this.strokeRequested) return;
+        this.strokeRequested = true;
+
+        requestAnimationFrame(() => {
+            this.strokeRequested = false;
+            // 已安排整体重绘时由重绘画出完整的当前路径
+            if (this.redrawRequested) return;
+
+            const path = this.currentPath;
+            const start = Math.max(this.drawnStrokeLength - 1, 0);
+            if (path.length - start < 2) return;
+
+            this.ctx.strokeStyle = "#ffff00";
+            this.ctx.lineWidth = 2;
+            this.ctx.lineCap = 'round';
+            this.ctx.lineJoin = 'round';
+
+            this.ctx.beginPath();
+            this.ctx.moveTo(path[start].x, path[start].y);
+            for (let i = start + 1; i < path.length; i++) {
+                this.ctx.lineTo(path[i].x, path[i].y);
+            }
+            this.ctx.stroke();
+            this.drawnStrokeLength = path.length;
+        });
+    }
+
     performRedraw() {
-        // 清除画布
+        // 只清除覆盖画布上的路径，图像在下层的 <img> 中，不需要重绘
         this.ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
 
-        // 重新绘制原始图像
-        if (this.originalImageData) {
-            this.ctx.putImageData(this.originalImageData, 0, 0);
-        }
-
         // 设置抗锯齿绘制参数
-        this.ctx.imageSmoothingEnabled = true;
-        this.ctx.imageSmoothingQuality = 'high';
         this.ctx.lineCap = 'round';
         this.ctx.lineJoin = 'round';
 
@@ -483,6 +580,7 @@ class IrregularCropper {
 
             this.ctx.stroke();
         }
+        this.drawnStrokeLength = this.currentPath.length;
     }
 
     async applyIrregularCrop() {
@@ -491,23 +589,34 @@ class IrregularCropper {
             return;
         }
 
+        // 请求期间可能切换到其他会话，结束时按提交时的会话移除
+        const sessionId = this.activeSessionId;
+
         try {
-            const response = await api.fetchApi("/irregular_cropper/apply", {
+            // 紧凑格式：路径以小端 float32 的 x,y 交替序列发送，不截断，由服务端按容差简化
+            const coords = new Float32Array(this.pathPoints.length * 2);
+            this.pathPoints.forEach((point, i) => {
+                coords[i * 2] = point.x;
+                coords[i * 2 + 1] = point.y;
+            });
+
+            const params = new URLSearchParams({
+                node_id: this.currentNodeId,
+                session_id: sessionId,
+                image_width: this.canvas.width,
+                image_height: this.canvas.height,
+                drawing_mode: this.drawingMode
+            });
+            const response = await api.fetchApi(`/irregular_cropper/apply?${params}`, {
                 method: "POST",
                 headers: {
-                    "Content-Type": "application/json",
+                    "Content-Type": "application/octet-stream",
                 },
-                body: JSON.stringify({
-                    node_id: this.currentNodeId,
-                    path_points: this.pathPoints.slice(0, 2000), // 适当的点数限制
-                    image_width: this.canvas.width,
-                    image_height: this.canvas.height,
-                    drawing_mode: this.drawingMode
-                })
+                body: coords.buffer
             });
 
             const result = await response.json();
-            this.cleanupAndClose();
+            this.cleanupAndClose(false, sessionId);
 
         } catch (error) {
             console.error("异形裁剪操作失败:", error);
@@ -515,101 +624,296 @@ class IrregularCropper {
         }
     }
 
-    async cleanupAndClose(cancelled = false) {
+    async cleanupAndClose(cancelled = false, sessionId = this.activeSessionId) {
+        const session = this.sessions.get(sessionId);
+
         // 发送取消信号
-        if (cancelled && this.currentNodeId) {
-            try {
-                await api.fetchApi("/irregular_cropper/cancel", {
-                    method: "POST",
-                    headers: {
-                        "Content-Type": "application/json",
-                    },
-                    body: JSON.stringify({
-                        node_id: this.currentNodeId
-                    })
-                });
-            } catch (error) {
-                console.error("发送取消信号失败:", error);
-            }
+        if (cancelled && session) {
+            await this.sendCancel(session);
         }
 
         // 清理内存
-        this.pathPoints = [];
-        this.currentPath = [];
-        this.pathClosed = false;
-        this.isDrawing = false;
-        this.originalImageData = null;
+        if (sessionId === this.activeSessionId) {
+            this.pathPoints = [];
+            this.currentPath = [];
+            this.pathClosed = false;
+            this.isDrawing = false;
+            this.activeSessionId = null;
+        }
+        this.removeSession(sessionId);
+    }
+
+    async sendCancel(session) {
+        try {
+            await api.fetchApi("/irregular_cropper/cancel", {
+                method: "POST",
+                headers: {
+                    "Content-Type": "application/json",
+                },
+                body: JSON.stringify({
+                    node_id: session.nodeId,
+                    session_id: session.id
+                })
+            });
+        } catch (error) {
+            console.error("发送取消信号失败:", error);
+        }
+    }
+
+    // 关闭对话框并取消所有待处理的会话
+    async cancelAll() {
+        const sessions = [...this.sessions.values()];
+        this.sessions.clear();
+        this.activeSessionId = null;
+        this.removeSession(null);
+        await Promise.all(sessions.map(session => this.sendCancel(session)));
+    }
+
+    // 加入待处理会话：对话框未打开时立即显示，已打开时只加入胶片栏，不打断当前绘制
+    enqueue(detail, imageUrl, thumbnailUrl, title) {
+        this.initialize();
+        const id = detail.session_id || String(detail.node_id);
+
+        // 同一节点重新执行时，旧会话已在服务端被替换
+        for (const [otherId, other] of this.sessions) {
+            if (other.nodeId === detail.node_id && otherId !== id) {
+                this.sessions.delete(otherId);
+                if (otherId === this.activeSessionId) {
+                    this.activeSessionId = null;
+                }
+            }
+        }
+
+        if (!this.sessions.has(id)) {
+            this.sessions.set(id, {
+                id,
+                nodeId: detail.node_id,
+                promptId: detail.prompt_id,
+                config: detail,
+                imageUrl,
+                thumbnailUrl,
+                title,
+                drawingMode: detail.crop_mode,
+                pathPoints: [],
+                pathClosed: false
+            });
+        }
+
+        if (!this.activeSessionId) {
+            this.activate(id);
+        } else {
+            this.renderFilmstrip();
+        }
+    }
+
+    // 会话已在服务端结束（超时、被替换或已提交）
+    discard(sessionId) {
+        if (!this.sessions.has(sessionId)) {
+            return;
+        }
+        this.cleanupAndClose(false, sessionId);
+    }
+
+    removeSession(sessionId) {
+        this.sessions.delete(sessionId);
+        if (this.activeSessionId && this.sessions.has(this.activeSessionId)) {
+            this.renderFilmstrip();
+            return;
+        }
+
+        // 切换到下一个待处理的会话，没有时关闭窗口
+        const next = this.sessions.keys().next();
+        if (!next.done) {
+            this.activate(next.value);
+            return;
+        }
 
-        // 清理画布
         if (this.ctx && this.canvas) {
             this.ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
         }
-
-        // 关闭窗口
+        // 释放背景图像的解码数据
+        if (this.image) {
+            this.image.onload = this.image.onerror = null;
+            this.image.removeAttribute("src");
+            this.imageUrl = null;
+        }
         if (this.modal) {
             this.modal.close();
         }
     }
 
-    show(nodeId, imageData, config) {
-        this.initialize();
-        this.currentNodeId = nodeId;
-        this.config = config;
+    saveActiveState() {
+        const session = this.sessions.get(this.activeSessionId);
+        if (session) {
+            session.pathPoints = this.pathPoints;
+            session.pathClosed = this.pathClosed;
+            session.drawingMode = this.drawingMode;
+        }
+    }
+
+    activate(sessionId) {
+        if (sessionId === this.activeSessionId) {
+            return;
+        }
+        this.saveActiveState();
+
+        const session = this.sessions.get(sessionId);
+        this.activeSessionId = sessionId;
+        this.currentNodeId = session.nodeId;
+        this.config = session.config;
+        this.pathPoints = session.pathPoints;
+        this.pathClosed = session.pathClosed;
+        this.currentPath = [];
+        this.isDrawing = false;
 
         // 设置模式
-        const modeInput = this.modal.querySelector(`input[value="${config.crop_mode}"]`);
+        this.drawingMode = session.drawingMode;
+        const modeInput = this.modal.querySelector(`input[value="${session.drawingMode}"]`);
         if (modeInput) {
             modeInput.checked = true;
-            this.drawingMode = config.crop_mode;
         }
 
-        const img = new Image();
-        img.onload = () => {
-            const imageSize = img.width * img.height;
-            if (imageSize > this.maxImageSize) {
-                alert(`图像过大 (${img.width}x${img.height})，可能导致浏览器崩溃。请使用较小的图像。`);
+        this.renderFilmstrip();
+        this.loadImage(session);
+    }
+
+    renderFilmstrip() {
+        const sessions = [...this.sessions.values()];
+        const strip = this.modal.querySelector(".irregular-cropper-filmstrip");
+        strip.replaceChildren(...sessions.map(session => {
+            const item = document.createElement("button");
+            item.className = "filmstrip-item";
+            item.classList.toggle("active", session.id === this.activeSessionId);
+            item.classList.toggle("has-path", session.pathPoints.length > 0);
+            item.title = session.title;
+
+            const thumbnail = document.createElement("img");
+            thumbnail.src = session.thumbnailUrl;
+            thumbnail.loading = "lazy";
+            const label = document.createElement("span");
+            label.textContent = session.title;
+
+            item.append(thumbnail, label);
+            item.addEventListener("click", () => this.activate(session.id));
+            return item;
+        }));
+
+        // 只有一个会话时不显示胶片栏
+        const multiple = sessions.length > 1;
+        strip.style.display = multiple ? "" : "none";
+        this.modal.querySelector("#cancel-all-irregular-crop").style.display = multiple ? "" : "none";
+
+        const index = sessions.findIndex(session => session.id === this.activeSessionId) + 1;
+        this.modal.querySelector(".irregular-cropper-title").textContent =
+            multiple ? `异形图像裁剪 (${index}/${sessions.length})` : "异形图像裁剪";
+    }
+
+    loadImage(session) {
+        const img = this.image;
+        const onload = () => {
+            // 加载期间已切换到其他会话
+            if (session.id !== this.activeSessionId) {
                 return;
             }
 
-            this.canvas.width = img.width;
-            this.canvas.height = img.height;
-
-            // 启用高质量绘制
-            this.ctx.imageSmoothingEnabled = true;
-            this.ctx.imageSmoothingQuality = 'high';
-            this.ctx.drawImage(img, 0, 0);
+            const imageSize = img.naturalWidth * img.naturalHeight;
+            if (imageSize > this.maxImageSize) {
+                alert(`图像过大 (${img.naturalWidth}x${img.naturalHeight})，可能导致浏览器崩溃。请使用较小的图像。`);
+                return;
+            }
 
-            // 保存原始图像数据
-            this.originalImageData = this.ctx.getImageData(0, 0, this.canvas.width, this.canvas.height);
+            // 覆盖画布与图像同为原始像素尺寸，坐标不变；画布本身透明，不保存图像像素
+            this.canvas.width = img.naturalWidth;
+            this.canvas.height = img.naturalHeight;
+            this.redrawCanvas();
 
-            this.modal.showModal();
+            if (!this.modal.open) {
+                this.modal.showModal();
+            }
         };
 
+        img.onload = onload;
         img.onerror = (error) => {
             console.error("图像加载失败:", error);
             alert("图像加载失败");
         };
 
-        img.src = imageData;
+        // 相同地址不会再次触发 load
+        if (this.imageUrl === session.imageUrl && img.complete && img.naturalWidth) {
+            onload();
+            return;
+        }
+        this.imageUrl = session.imageUrl;
+        img.src = session.imageUrl;
     }
 }
 
+// 预览图通过GET接口以二进制获取；高分屏按像素比请求更高分辨率，服务端取整到尺寸档位并预先编码最近请求的档位
+function getIrregularCropperPreviewUrl(handle, config) {
+    const pixelRatio = window.devicePixelRatio || 1;
+    const previewSize = Math.ceil((config.preview_size || 1024) * Math.max(1, pixelRatio));
+    const fullSize = Math.max(config.preview_width || 0, config.preview_height || 0) || previewSize;
+    const maxSize = Math.max(256, Math.min(previewSize, fullSize));
+
+    // primary 让服务端记住该尺寸档位，之后的会话按此尺寸预先编码（高分屏为2048而不是1024）
+    const params = new URLSearchParams({ max_size: maxSize, format: "webp", quality: 85, primary: 1 });
+    return api.apiURL(`/irregular_cropper/preview/${handle}?${params}`);
+}
+
+// 胶片栏缩略图，服务端缩略图金字塔中取最小的一级
+function getIrregularCropperThumbnailUrl(handle) {
+    const params = new URLSearchParams({ max_size: 160, format: "webp", quality: 75 });
+    return api.apiURL(`/irregular_cropper/preview/${handle}?${params}`);
+}
+
 // 全局实例
 let globalIrregularCropper = null;
 
+// 旧版本节点的控件顺序：5个后端输入之后是前端添加的控件；此后新增的后端输入排在前端控件之前
+const LEGACY_WIDGET_NAMES = ["crop_mode", "background_fill", "edge_smooth", "auto_crop", "crop_padding",
+    "使用说明", "seed", "seed_mode", "更新种子"];
+
+function enqueueIrregularCropperSession(detail) {
+    const { node_id, image_data, preview_handle, ...config } = detail;
+    const node = app.graph.getNodeById(node_id);
+    if (!node) {
+        return;
+    }
+    const imageUrl = preview_handle ? getIrregularCropperPreviewUrl(preview_handle, config) : image_data;
+    const thumbnailUrl = preview_handle ? getIrregularCropperThumbnailUrl(preview_handle) : image_data;
+    const title = `${node.title || "异形图像裁剪"} #${node_id}`;
+    globalIrregularCropper.enqueue(detail, imageUrl, thumbnailUrl, title);
+}
+
+// 页面刷新或重新连接后，恢复服务端仍在等待的会话
+async function restoreIrregularCropperSessions() {
+    try {
+        const response = await api.fetchApi("/irregular_cropper/pending");
+        const { sessions = [] } = await response.json();
+        sessions.forEach(enqueueIrregularCropperSession);
+    } catch (error) {
+        console.error("获取待处理会话失败:", error);
+    }
+}
+
 // 注册节点扩展
 app.registerExtension({
     name: "Comfy.IrregularCropper",
     async setup() {
         globalIrregularCropper = new IrregularCropper();
 
+        // 同一任务中多个节点的会话会依次到达，都加入同一个对话框
         api.addEventListener("irregular_cropper_update", ({ detail }) => {
-            const { node_id, image_data, ...config } = detail;
-            const node = app.graph.getNodeById(node_id);
-            if (node) {
-                globalIrregularCropper.show(node_id, image_data, config);
-            }
+            enqueueIrregularCropperSession(detail);
+        });
+
+        // 会话在服务端结束（超时或被替换）时从对话框中移除
+        api.addEventListener("irregular_cropper_closed", ({ detail }) => {
+            globalIrregularCropper.discard(detail.session_id);
         });
+
+        api.addEventListener("reconnected", restoreIrregularCropperSessions);
+        restoreIrregularCropperSessions();
     },
 
     async beforeRegisterNodeDef(nodeType, nodeData) {
@@ -626,15 +930,24 @@ app.registerExtension({
                     serialize: false
                 });
 
-                // Seed控制逻辑
-                const seedWidget = this.addWidget("number", "seed", 0, (value) => {
-                    this.seed = value;
-                }, {
-                    min: 0,
-                    max: Number.MAX_SAFE_INTEGER,
-                    step: 1,
-                    precision: 0
-                });
+                // Seed控制逻辑：复用后端声明的seed输入，使其值随任务提交用于选区缓存
+                let seedWidget = this.widgets?.find(w => w.name === "seed");
+                if (seedWidget) {
+                    const seedCallback = seedWidget.callback;
+                    seedWidget.callback = (value, ...args) => {
+                        this.seed = value;
+                        return seedCallback?.call(seedWidget, value, ...args);
+                    };
+                } else {
+                    seedWidget = this.addWidget("number", "seed", 0, (value) => {
+                        this.seed = value;
+                    }, {
+                        min: 0,
+                        max: Number.MAX_SAFE_INTEGER,
+                        step: 1,
+                        precision: 0
+                    });
+                }
 
                 const seed_modeWidget = this.addWidget("combo", "seed_mode", "randomize", () => { }, {
                     values: ["fixed", "increment", "decrement", "randomize"],
@@ -650,7 +963,8 @@ app.registerExtension({
                     } else if (mode === "increment") {
                         newValue += 1;
                     } else if (mode === "decrement") {
-                        newValue -= 1;
+                        // 后端seed最小为0，递减到0后保持不变
+                        newValue = Math.max(0, newValue - 1);
                     } else if (mode === "fixed") {
                         if (!this.hasFixedSeed) {
                             newValue = Math.floor(Math.random() * Number.MAX_SAFE_INTEGER);
@@ -677,7 +991,8 @@ app.registerExtension({
                     } else if (mode === "increment") {
                         newValue += 1;
                     } else if (mode === "decrement") {
-                        newValue -= 1;
+                        // 后端seed最小为0，递减到0后保持不变
+                        newValue = Math.max(0, newValue - 1);
                     } else if (mode === "fixed") {
                         newValue = Math.floor(Math.random() * Number.MAX_SAFE_INTEGER);
                         this.hasFixedSeed = true;
@@ -686,6 +1001,24 @@ app.registerExtension({
                     seedWidget.value = newValue;
                     seedWidget.callback(newValue);
                 });
+
+                this.widgetDefaults = new Map(this.widgets.map(w => [w.name, w.value]));
+            };
+
+            // 工作流按序号恢复控件值：旧版本保存的值会整体错位（如 seed 落到新的后端输入上），按控件名重新对应
+            const onConfigure = nodeType.prototype.onConfigure;
+            nodeType.prototype.onConfigure = function (info) {
+                onConfigure?.apply(this, arguments);
+
+                const values = info?.widgets_values;
+                if (!Array.isArray(values) || values.length > LEGACY_WIDGET_NAMES.length || !this.widgets) {
+                    return;
+                }
+                for (const widget of this.widgets) {
+                    const index = LEGACY_WIDGET_NAMES.indexOf(widget.name);
+                    const value = index >= 0 ? values[index] : undefined;
+                    widget.value = value ?? this.widgetDefaults?.get(widget.name) ?? widget.value;
+                }
             };
         }
     }